@@ -0,0 +1,168 @@
+"""Аутентификация по токену с кешем пользователя.
+
+``TokenAuthentication`` на каждый запрос читает токен с пользователем
+из БД. Здесь пользователь по токену берётся сначала из памяти процесса
+(на ``AUTH_TOKEN_LOCAL_TIMEOUT`` секунд), затем из общего кеша (на
+``AUTH_TOKEN_CACHE_TIMEOUT`` секунд), и только потом из БД. Ключ
+кеша - SHA-256 токена, сам токен в кеш не попадает.
+
+Записи удаляются при удалении токена (выход через djoser, удаление
+пользователя) и при сохранении пользователя, кроме обновления
+``last_login``: так смена пароля, деактивация и правка профиля сразу
+перестают отдавать старого пользователя. В памяти других процессов
+запись живёт не дольше ``AUTH_TOKEN_LOCAL_TIMEOUT``.
+
+В кеше хранятся значения полей, а не объект модели: каждый запрос
+получает собственный объект. Небезопасные методы читают пользователя
+из БД, чтобы ``save()`` в представлениях не записал устаревшие пароль,
+``is_active`` или ``is_staff``.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.fields.files import FieldFile
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+LOCAL_MAX_ENTRIES = 10000
+
+
+def token_cache_key(key):
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def user_values(user):
+    """Значения полей пользователя для кеша: ``(имена, значения)``."""
+    names, values = [], []
+    for field in user._meta.concrete_fields:
+        value = getattr(user, field.attname)
+        names.append(field.attname)
+        values.append(value.name if isinstance(value, FieldFile) else value)
+    return tuple(names), tuple(values)
+
+
+def build_user(user_model, cached):
+    """Новый объект пользователя из значений полей кеша."""
+    names, values = cached
+    # JSON-поля изменяемы, а значения из памяти процесса общие.
+    return user_model.from_db(
+        DEFAULT_DB_ALIAS, list(names), copy.deepcopy(list(values)))
+
+
+class LocalTokenCache:
+    """Поля пользователей по ключу кеша в памяти процесса, с TTL."""
+
+    def __init__(self, max_entries=LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            values, expires = entry
+            if expires < time.monotonic():
+                del self._entries[cache_key]
+                return None
+            return values
+
+    def set(self, cache_key, values, timeout):
+        with self._lock:
+            self._entries[cache_key] = (values, time.monotonic() + timeout)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, cache_keys):
+        with self._lock:
+            for cache_key in cache_keys:
+                self._entries.pop(cache_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_tokens = LocalTokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` с двумя уровнями кеша."""
+
+    def authenticate(self, request):
+        # Объект создаётся на каждый запрос, поэтому метод можно
+        # запомнить до разбора заголовка в родительском классе.
+        self.use_cache = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        cached = None
+        if getattr(self, 'use_cache', True):
+            cached = local_tokens.get(cache_key)
+            if cached is None:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    local_tokens.set(cache_key, cached,
+                                     settings.AUTH_TOKEN_LOCAL_TIMEOUT)
+        if cached is None:
+            user = self.load_user(key)
+            cached = user_values(user)
+            cache.set(cache_key, cached,
+                      timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            local_tokens.set(cache_key, cached,
+                             settings.AUTH_TOKEN_LOCAL_TIMEOUT)
+        else:
+            user = build_user(self.get_model().user.field.related_model,
+                              cached)
+        token = self.get_model()(key=key, user=user)
+        token._state.adding = False
+        return user, token
+
+    def load_user(self, key):
+        try:
+            token = self.get_model().objects.select_related('user').get(
+                key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return token.user
+
+
+def _forget(cache_keys):
+    cache.delete_many(cache_keys)
+    local_tokens.delete_many(cache_keys)
+
+
+def forget_tokens(keys):
+    """Удалить пользователей по токенам ``keys`` из кеша.
+
+    Записи удаляются сразу и ещё раз после фиксации транзакции: запрос,
+    прочитавший данные до фиксации, мог успеть вернуть их в кеш.
+    """
+    cache_keys = [token_cache_key(key) for key in keys]
+    if not cache_keys:
+        return
+    _forget(cache_keys)
+    transaction.on_commit(lambda: _forget(cache_keys))
+
+
+def forget_user(user_id):
+    """Удалить из кеша все токены пользователя."""
+    forget_tokens(
+        Token.objects.filter(user_id=user_id)
+        .values_list('key', flat=True)
+    )
@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+RECIPES_VERSION_KEY = 'recipes:version'
+TAGS_VERSION_KEY = 'tags:version'
+INGREDIENTS_VERSION_KEY = 'ingredients:version'
+
+
+def _new_version():
+    """Новая версия - текущее время в наносекундах.
+
+    Так версия служит и временем последнего изменения, а после
+    вытеснения ключа из кеша не совпадёт ни с одной прежней.
+    """
+    return time.time_ns()
+
+
+def get_versions(keys):
+    """Получить версии по списку ключей, создав недостающие."""
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+def bump_version(*keys):
+    """Обновить версии, сделав устаревшими зависящие от них записи."""
+    version = _new_version()
+    cache.set_many(dict.fromkeys(keys, version), timeout=None)
+
+
+class LocalVersionedValue:
+    """Значение в памяти процесса, привязанное к версии из кеша.
+
+    При каждом обращении версия ``version_key`` сверяется с общим
+    кешем, поэтому после её обновления все процессы пересобирают
+    значение вызовом ``build`` при следующем запросе.
+    """
+
+    def __init__(self, version_key, build):
+        self.version_key = version_key
+        self.build = build
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def get(self):
+        version = get_versions([self.version_key])[self.version_key]
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._value = self.build()
+                    self._version = version
+        return self._value
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe:version:{recipe_id}'
+
+
+def author_version_key(author_id):
+    return f'author:version:{author_id}'
+
+
+def user_state_version_key(user_id):
+    """Версия избранного, списка покупок и подписок пользователя."""
+    return f'user:state:version:{user_id}'
+
+
+def profile_version_key(user_id):
+    """Версия профиля: рецепты, подписки и избранное его рецептов."""
+    return f'profile:version:{user_id}'
+
+
+def bump_recipe_version(*recipe_ids):
+    bump_version(
+        RECIPES_VERSION_KEY,
+        *(recipe_version_key(pk) for pk in recipe_ids),
+    )
+
+
+def bump_author_version(*author_ids):
+    bump_version(
+        RECIPES_VERSION_KEY,
+        *(author_version_key(pk) for pk in author_ids),
+    )
+
+
+def bump_user_state_version(user_id):
+    bump_version(user_state_version_key(user_id))
+
+
+def bump_profile_version(*user_ids):
+    bump_version(*(profile_version_key(pk) for pk in user_ids))
+
+
+def get_recipe_fragments(recipes, build, request):
+    """Получить независящие от пользователя представления рецептов.
+
+    Ключ фрагмента включает версию рецепта, версию автора, версии
+    справочников тегов и ингредиентов и базовый URL запроса (в
+    представлении абсолютные ссылки на изображения).
+    Промахи строятся вызовом ``build`` для списка рецептов и
+    сохраняются в кеш. Возвращает словарь ``{id рецепта: фрагмент}``.
+    """
+    if not recipes:
+        return {}
+    versions = get_versions(
+        [TAGS_VERSION_KEY, INGREDIENTS_VERSION_KEY]
+        + [recipe_version_key(recipe.id) for recipe in recipes]
+        + [author_version_key(recipe.author_id) for recipe in recipes]
+    )
+    base_url = request.build_absolute_uri('/') if request else ''
+    shared = hashlib.md5('{}:{}:{}'.format(
+        versions[TAGS_VERSION_KEY],
+        versions[INGREDIENTS_VERSION_KEY],
+        base_url,
+    ).encode()).hexdigest()[:12]
+    keys = {
+        recipe.id: 'recipe:fragment:{}:{}:{}:{}'.format(
+            recipe.id,
+            versions[recipe_version_key(recipe.id)],
+            versions[author_version_key(recipe.author_id)],
+            shared,
+        )
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    fragments = {
+        recipe_id: cached[key]
+        for recipe_id, key in keys.items() if key in cached
+    }
+    misses = [recipe for recipe in recipes if recipe.id not in fragments]
+    if misses:
+        built = build(misses)
+        cache.set_many(
+            {keys[recipe_id]: fragment
+             for recipe_id, fragment in built.items()},
+            timeout=FRAGMENT_TIMEOUT,
+        )
+        fragments.update(built)
+    return fragments
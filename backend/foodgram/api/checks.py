@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Кеш по умолчанию должен быть общим для процессов.
+
+    Версии кеша, фрагменты, снимок статистики и сброс токенов в кеше
+    одного процесса не видны остальным.
+    """
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'Кеш по умолчанию хранится в памяти процесса.',
+        hint='Задайте REDIS_URL или CACHE_BACKEND с общим кешем.',
+        id='api.W001',
+    )]
+
+
+@register(deploy=True)
+def check_task_broker(app_configs, **kwargs):
+    """Задачи Celery не должны выполняться в запросе.
+
+    Без брокера уменьшенные копии фото делаются при загрузке, а задачи
+    по расписанию не запускаются.
+    """
+    if not settings.CELERY_TASK_ALWAYS_EAGER:
+        return []
+    return [Warning(
+        'Задачи Celery выполняются сразу в процессе, который их ставит.',
+        hint='Задайте RABBITMQ_HOST и запустите воркер foodgram.celery.',
+        id='api.W002',
+    )]
@@ -0,0 +1,84 @@
+"""Быстрые сериализаторы только для чтения.
+
+Строят те же словари, что и сериализаторы из ``api.serializers``, но
+напрямую из загруженных объектов, без полей DRF. Порядок ключей и
+значения совпадают с обычными сериализаторами, поэтому JSON ответа
+не меняется.
+"""
+from api.images import rendition_urls
+
+
+def _file_url(file, request):
+    """Ссылка на файл так, как её отдаёт ``ImageField`` DRF."""
+    if not file:
+        return None
+    url = file.url
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def serialize_ingredient_recipe(ingredient_recipe):
+    ingredient = ingredient_recipe.ingredient
+    return {
+        'id': ingredient.id,
+        'name': ingredient.name,
+        'measurement_unit': ingredient.measurement_unit,
+        'amount': ingredient_recipe.amount,
+    }
+
+
+def serialize_user(user, request, subscribed_ids):
+    if hasattr(user, 'is_subscribed'):
+        is_subscribed = user.is_subscribed
+    else:
+        is_subscribed = user.id in subscribed_ids
+    return {
+        'email': user.email,
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_subscribed': is_subscribed,
+        'avatar': _file_url(user.avatar, request),
+        'avatar_renditions': rendition_urls(
+            user.avatar, user.avatar_renditions, request),
+    }
+
+
+def serialize_recipe(recipe, request, subscribed_ids, tags):
+    """Аналог ``RecipeSerializer``.
+
+    Связи должны быть подгружены ``load_recipe_relations``, теги
+    берутся из справочника ``tags``.
+    """
+    data = {'id': recipe.id}
+    if hasattr(recipe, 'is_favorited'):
+        data['is_favorited'] = bool(recipe.is_favorited)
+    if hasattr(recipe, 'is_in_shopping_cart'):
+        data['is_in_shopping_cart'] = bool(recipe.is_in_shopping_cart)
+    data['tags'] = tags.serialize(recipe.tag_ids)
+    data['author'] = serialize_user(recipe.author, request, subscribed_ids)
+    data['ingredients'] = [
+        serialize_ingredient_recipe(ingredient_recipe)
+        for ingredient_recipe in recipe.ingredientrecipe_set.all()
+    ]
+    data['image_renditions'] = rendition_urls(
+        recipe.image, recipe.image_renditions, request)
+    data['name'] = recipe.name
+    data['image'] = _file_url(recipe.image, request)
+    data['text'] = recipe.text
+    data['cooking_time'] = recipe.cooking_time
+    return data
+
+
+def serialize_recipe_short(recipe, request=None):
+    """Аналог ``RecipeShortSerializer``."""
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'image': _file_url(recipe.image, request),
+        'image_renditions': rendition_urls(
+            recipe.image, recipe.image_renditions, request),
+        'cooking_time': recipe.cooking_time,
+    }
@@ -0,0 +1,40 @@
+"""Чтение ленты ``/api/users/feed/``.
+
+Страница ленты - это записи ``FeedEntry`` пользователя по индексу
+``(user, -pub_date, -recipe)``. Рецепты авторов с подмешиванием при
+чтении добавляются отдельным запросом к ``Recipe`` и сливаются с
+записями ленты по тому же ключу.
+"""
+from django.db.models import Q
+
+from api.serializers import get_subscribed_ids
+from recipes.feed import pull_author_ids
+from recipes.models import FeedEntry, Recipe
+
+
+def _after(after, id_field):
+    """Условие "строго после ключа ``(дата, id рецепта)``"."""
+    if after is None:
+        return Q()
+    pub_date, recipe_id = after
+    return Q(pub_date__lt=pub_date) | Q(
+        pub_date=pub_date, **{f'{id_field}__lt': recipe_id})
+
+
+def feed_recipe_ids(request, after, limit):
+    """id первых ``limit`` рецептов ленты после ключа ``after``."""
+    keys = list(
+        FeedEntry.objects.filter(_after(after, 'recipe_id'),
+                                 user=request.user)
+        .order_by('-pub_date', '-recipe_id')
+        .values_list('pub_date', 'recipe_id')[:limit]
+    )
+    pulled = pull_author_ids() & get_subscribed_ids(request)
+    if pulled:
+        keys += (
+            Recipe.objects.filter(_after(after, 'id'), author_id__in=pulled)
+            .order_by('-pub_date', '-id')
+            .values_list('pub_date', 'id')[:limit]
+        )
+        keys = sorted(set(keys), reverse=True)[:limit]
+    return [recipe_id for _, recipe_id in keys]
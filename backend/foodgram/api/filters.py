@@ -1,6 +1,11 @@
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe
+from api.tag_registry import tag_registry
+from recipes.models import Recipe, TagRecipe
+
+
+def tag_choices():
+    return tag_registry.get().choices()
 
 
 class RecipeFilter(filters.FilterSet):
@@ -9,7 +14,10 @@ class RecipeFilter(filters.FilterSet):
     is_favorited = filters.Filter(field_name='is_favorited')
     is_in_shopping_cart = filters.Filter(field_name='is_in_shopping_cart')
     author = filters.Filter(field_name='author__id')
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags',
+    )
 
     class Meta:
         model = Recipe
@@ -20,11 +28,10 @@ class RecipeFilter(filters.FilterSet):
             'tags',
         ]
 
-
-class IngredientFilter(filters.FilterSet):
-    """Фильтрсет для фильтрации ингредиентов."""
-    name = filters.CharFilter(lookup_expr='istartswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
\ No newline at end of file
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов; слаги из справочника."""
+        if not value:
+            return queryset
+        return queryset.filter(id__in=TagRecipe.objects.filter(
+            tag_id__in=tag_registry.get().ids_for_slugs(value)
+        ).values('recipe_id'))
@@ -0,0 +1,183 @@
+"""Загрузка картинок и их уменьшенные копии.
+
+Картинка из data URI декодируется кусками во временный файл с
+проверкой размера, а в запросе проверяется только сигнатура формата.
+Полное декодирование Pillow и копии ``RENDITIONS`` делает задача
+Celery после сохранения рецепта или пользователя. Пока копий нет,
+вместо них отдаётся ссылка на оригинал.
+"""
+import base64
+import binascii
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+from rest_framework import serializers
+
+RENDITIONS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+RENDITION_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+RENDITION_QUALITY = 80
+DECODE_CHUNK = 64 * 1024
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'RIFF', 'webp'),
+)
+
+
+def detect_format(head):
+    """Расширение по первым байтам файла или ``None``."""
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            if extension == 'webp' and head[8:12] != b'WEBP':
+                continue
+            return extension
+    return None
+
+
+def too_large_error():
+    limit = settings.MAX_IMAGE_UPLOAD_SIZE // (1024 * 1024)
+    return serializers.ValidationError(
+        f'Размер изображения больше {limit} МБ.')
+
+
+def decode_data_uri(value):
+    """Декодировать ``data:image/...;base64,...`` во временный файл.
+
+    Данные декодируются кусками, и декодирование прерывается, как
+    только размер превышает ``MAX_IMAGE_UPLOAD_SIZE``.
+    """
+    header, separator, payload = value.partition(';base64,')
+    if not separator:
+        raise serializers.ValidationError('Ожидалось изображение в base64.')
+    limit = settings.MAX_IMAGE_UPLOAD_SIZE
+    if len(payload) // 4 * 3 > limit + 2:
+        raise too_large_error()
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    size = 0
+    try:
+        for start in range(0, len(payload), DECODE_CHUNK):
+            chunk = base64.b64decode(
+                payload[start:start + DECODE_CHUNK], validate=True)
+            size += len(chunk)
+            if size > limit:
+                raise too_large_error()
+            output.write(chunk)
+    except (binascii.Error, ValueError):
+        output.close()
+        raise serializers.ValidationError('Некорректные данные base64.')
+    except serializers.ValidationError:
+        output.close()
+        raise
+    output.seek(0)
+    return File(output, name='image')
+
+
+def check_image(file):
+    """Проверить сигнатуру и дать файлу расширение по ней."""
+    file.seek(0)
+    extension = detect_format(file.read(16))
+    file.seek(0)
+    if extension is None:
+        raise serializers.ValidationError(
+            'Загрузите корректное изображение.')
+    stem = os.path.splitext(os.path.basename(file.name or 'image'))[0]
+    file.name = f'{stem}.{extension}'
+    return file
+
+
+class Base64ImageField(serializers.FileField):
+    """Изображение файлом или data URI.
+
+    Pillow в запросе не используется: проверяются размер и сигнатура,
+    а само изображение разбирает задача, которая делает копии.
+    """
+
+    def to_internal_value(self, data):
+        """Декодирует изображение."""
+        if isinstance(data, str) and data.startswith('data:image'):
+            data = decode_data_uri(data)
+        elif getattr(data, 'size', 0) > settings.MAX_IMAGE_UPLOAD_SIZE:
+            raise too_large_error()
+        return check_image(super().to_internal_value(data))
+
+
+def render(name, storage=default_storage):
+    """Сделать копии картинки ``name`` из хранилища.
+
+    Возвращает ``{'source': name, размер: путь копии}``. Для файла,
+    который Pillow не может открыть, копий нет.
+    """
+    renditions = {'source': name}
+    try:
+        with storage.open(name) as source, Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert(
+                'RGBA' if RENDITION_FORMAT == 'WEBP'
+                and image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            stem = os.path.splitext(os.path.basename(name))[0]
+            extension = RENDITION_FORMAT.lower()
+            for size_name, size in RENDITIONS.items():
+                copy = image.copy()
+                copy.thumbnail(size)
+                buffer = io.BytesIO()
+                copy.save(buffer, format=RENDITION_FORMAT,
+                          quality=RENDITION_QUALITY)
+                renditions[size_name] = storage.save(
+                    f'renditions/{stem}.{size_name}.{extension}',
+                    File(buffer))
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        pass
+    return renditions
+
+
+def update_renditions(model, pk, field, renditions_field):
+    """Сделать копии картинки объекта и сохранить их пути.
+
+    Возвращает ``True``, если пути записаны. Если картинку успели
+    заменить, копии удаляются: их сделает следующая задача.
+    """
+    row = model.objects.filter(pk=pk).values_list(
+        field, renditions_field).first()
+    if row is None or not row[0] or (row[1] or {}).get('source') == row[0]:
+        return False
+    name, previous = row[0], row[1] or {}
+    renditions = render(name)
+    updated = model.objects.filter(pk=pk, **{field: name}).update(
+        **{renditions_field: renditions})
+    delete_renditions(previous if updated else renditions)
+    return bool(updated)
+
+
+def delete_renditions(renditions):
+    """Удалить файлы копий."""
+    for size_name in RENDITIONS:
+        if (renditions or {}).get(size_name):
+            default_storage.delete(renditions[size_name])
+
+
+def rendition_urls(file, renditions, request=None):
+    """Ссылки на копии картинки; вместо недостающих - на оригинал."""
+    if not file:
+        return None
+    renditions = renditions or {}
+    if renditions.get('source') != file.name:
+        renditions = {}
+    urls = {}
+    for size_name in RENDITIONS:
+        path = renditions.get(size_name)
+        url = default_storage.url(path) if path else file.url
+        urls[size_name] = (
+            request.build_absolute_uri(url) if request is not None else url)
+    return urls
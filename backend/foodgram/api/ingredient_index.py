@@ -0,0 +1,72 @@
+"""Индекс ингредиентов для автодополнения.
+
+Справочник ингредиентов небольшой и меняется редко, поэтому он
+целиком держится в памяти процесса: список в порядке ``id`` и список,
+отсортированный по названию в нижнем регистре, по которому префикс
+ищется бинарным поиском. Индекс пересобирается при смене версии
+``INGREDIENTS_VERSION_KEY``.
+"""
+from bisect import bisect_left
+from itertools import islice
+
+from api.cache import INGREDIENTS_VERSION_KEY, LocalVersionedValue
+from recipes.models import Ingredient
+
+AUTOCOMPLETE_LIMIT = 50
+
+
+class IngredientIndex:
+    """Ингредиенты в виде готовых представлений."""
+
+    def __init__(self, rows):
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for pk, name, unit in rows
+        ]
+        by_name = sorted(
+            (item['name'].casefold(), item['id'], item)
+            for item in self.items
+        )
+        self.keys = [key for key, _, _ in by_name]
+        self.sorted_items = [item for _, _, item in by_name]
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """Найти ингредиенты по части названия.
+
+        Сначала точные совпадения, затем начинающиеся с ``query``,
+        затем содержащие его; не больше ``limit`` результатов.
+        """
+        query = query.strip().casefold()
+        if not query:
+            return self.items[:limit]
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        matches = self.sorted_items[start:end]
+        exact = [
+            item for key, item in zip(self.keys[start:end], matches)
+            if key == query
+        ]
+        prefix = [
+            item for key, item in zip(self.keys[start:end], matches)
+            if key != query
+        ]
+        results = exact + prefix
+        if len(results) < limit:
+            results += islice(
+                (item for key, item in zip(self.keys, self.sorted_items)
+                 if query in key and not key.startswith(query)),
+                limit - len(results),
+            )
+        return results[:limit]
+
+
+def _build_index():
+    return IngredientIndex(
+        Ingredient.objects.order_by('id')
+        .values_list('id', 'name', 'measurement_unit')
+    )
+
+
+ingredient_index = LocalVersionedValue(INGREDIENTS_VERSION_KEY, _build_index)
@@ -0,0 +1,258 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.pagination import RecipeKeysetPagination
+from api.querysets import get_recipe_queryset
+from api.renderers import FastJSONRenderer
+from api.search import search_recipes
+from api.serializers import IngredientSerializer, RecipeSerializer
+from recipes import cart_totals
+from recipes.models import (Ingredient, IngredientRecipe, Recipe,
+                            ShoppingList, Tag, TagRecipe)
+from users.models import User
+
+
+class Rollback(Exception):
+    """Откат сгенерированных для замера данных."""
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Замеры производительности API на сгенерированных данных. '
+        'Все данные создаются в транзакции и откатываются после замера.'
+    )
+    scenarios = (
+        'pagination', 'serializers', 'renderers', 'search', 'shopping_cart',
+    )
+    words = (
+        'борщ', 'суп', 'свекла', 'капуста', 'картофель', 'курица', 'рис',
+        'пирог', 'яблоко', 'сметана', 'salad', 'chicken', 'baked', 'sauce',
+        'cooking', 'tomato', 'cheese', 'pasta', 'varenye', 'блины',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=self.scenarios)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--ingredients', type=int, default=2200)
+
+    def handle(self, *args, **options):
+        self.options = options
+        try:
+            with transaction.atomic():
+                getattr(self, f'bench_{options["scenario"]}')()
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed_recipes(self, count, ingredients_per_recipe=5, text=None):
+        """Создать автора, теги, ингредиенты и ``count`` рецептов."""
+        author = User.objects.create_user(
+            username='benchmark', email='benchmark@example.com',
+            password='benchmark', first_name='bench', last_name='mark',
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'bench{index}', color=f'#BE00{index:02X}',
+                slug=f'bench{index}')
+            for index in range(3)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench-ingredient-{index}',
+                       measurement_unit='г')
+            for index in range(ingredients_per_recipe)
+        )
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    name=f'bench-recipe-{index}',
+                    author=author,
+                    image='backend-media/recipes/images/bench.png',
+                    text=text() if text else 'Текст рецепта ' * 20,
+                    cooking_time=index % 120 + 1,
+                )
+                for index in range(count)
+            ),
+            batch_size=1000,
+        )
+        TagRecipe.objects.bulk_create(
+            (TagRecipe(recipe=recipe, tag=tags[recipe.id % len(tags)])
+             for recipe in recipes),
+            batch_size=1000,
+        )
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+             for recipe in recipes for ingredient in ingredients),
+            batch_size=1000,
+        )
+        return author
+
+    def measure(self, label, func):
+        """Выполнить ``func`` несколько раз и вывести медиану."""
+        timings = []
+        for _ in range(self.options['repeat']):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        median = statistics.median(timings)
+        self.stdout.write(f'{label}: {median * 1000:.2f} мс (медиана)')
+        return median
+
+    def get(self, client, url):
+        response = client.get(url, SERVER_NAME='localhost')
+        if response.status_code != 200:
+            raise CommandError(f'{url}: статус {response.status_code}')
+        return response
+
+    def bench_pagination(self):
+        """Страница ``--page``: OFFSET против пагинации по ключу."""
+        page, limit = self.options['page'], self.options['limit']
+        count = max(self.options['recipes'], page * limit)
+        self.seed_recipes(count)
+        client = APIClient()
+        paginator = RecipeKeysetPagination()
+        last_on_previous_page = Recipe.objects.order_by(
+            *paginator.ordering
+        )[(page - 1) * limit - 1]
+        cursor = paginator.encode_cursor(last_on_previous_page)
+        offset = self.measure(
+            f'offset, страница {page}',
+            lambda: self.get(client, f'/api/recipes/?page={page}'
+                                     f'&limit={limit}'),
+        )
+        keyset = self.measure(
+            f'keyset, страница {page}',
+            lambda: self.get(client, f'/api/recipes/?cursor={cursor}'
+                                     f'&limit={limit}'),
+        )
+        self.stdout.write(f'Ускорение: x{offset / keyset:.1f}')
+
+    def bench_serializers(self):
+        """Объектов в секунду: сериализаторы DRF против быстрого пути."""
+        count = self.options['recipes']
+        author = self.seed_recipes(count)
+        request = APIRequestFactory().get('/api/recipes/',
+                                          SERVER_NAME='localhost')
+        request.user = author
+        recipes = list(get_recipe_queryset(author))
+        results = {}
+        for fast in (False, True):
+            serializer = RecipeSerializer(context={
+                'request': request, 'fast_serialization': fast,
+            })
+            label = 'быстрый путь' if fast else 'DRF'
+            seconds = self.measure(
+                f'{label}, {count} рецептов',
+                lambda: serializer.build_fragments(recipes),
+            )
+            self.stdout.write(f'{label}: {count / seconds:.0f} объектов/с')
+            results[fast] = JSONRenderer().render(
+                list(serializer.build_fragments(recipes).values())
+            )
+        if results[False] != results[True]:
+            raise CommandError('Результаты сериализации различаются.')
+
+    def bench_renderers(self):
+        """Рендеринг JSON: DRF против orjson."""
+        author = self.seed_recipes(100)
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+             for index in range(self.options['ingredients'])),
+            batch_size=1000,
+        )
+        request = APIRequestFactory().get('/api/recipes/',
+                                          SERVER_NAME='localhost')
+        request.user = author
+        recipes = list(get_recipe_queryset(author))
+        serializer = RecipeSerializer(context={
+            'request': request, 'fast_serialization': True,
+        })
+        payloads = {
+            'страница из 100 рецептов': {
+                'count': len(recipes),
+                'next': None,
+                'previous': None,
+                'results': list(serializer.build_fragments(recipes).values()),
+            },
+            '/api/ingredients/ целиком': IngredientSerializer(
+                Ingredient.objects.all(), many=True).data,
+        }
+        for name, payload in payloads.items():
+            for renderer in (JSONRenderer(), FastJSONRenderer()):
+                self.measure(
+                    f'{name}, {type(renderer).__name__}',
+                    lambda: renderer.render(payload),
+                )
+
+    def bench_search(self):
+        """Поиск: ``icontains`` против полнотекстового индекса."""
+        generator = random.Random(0)
+        vocabulary = self.words + tuple(
+            f'слово{index}' for index in range(2000)
+        )
+        self.seed_recipes(
+            self.options['recipes'],
+            ingredients_per_recipe=0,
+            text=lambda: ' '.join(generator.choices(vocabulary, k=40)),
+        )
+        recipes = Recipe.objects.all()
+        search = 'сметана'
+
+        def icontains():
+            queryset = recipes.filter(
+                Q(name__icontains=search) | Q(text__icontains=search)
+            )
+            queryset.count()
+            list(queryset[:10])
+
+        def fulltext():
+            queryset = search_recipes(recipes, search)
+            queryset.count()
+            list(queryset.order_by('-search_rank')[:10])
+
+        self.measure('icontains', icontains)
+        self.measure('полнотекстовый поиск с ранжированием', fulltext)
+
+    def bench_shopping_cart(self):
+        """Список покупок из 500 рецептов: цикл против готовых сумм."""
+        author = self.seed_recipes(500, ingredients_per_recipe=20)
+        ShoppingList.objects.bulk_create(
+            ShoppingList(user=author, recipe=recipe)
+            for recipe in Recipe.objects.filter(author=author)
+        )
+        cart_totals.rebuild([author.id])
+        client = APIClient()
+        client.force_authenticate(author)
+
+        def python_loop():
+            ingredients = IngredientRecipe.objects.filter(
+                recipe__shopping_recipe__user=author
+            )
+            shopping_data = {}
+            for ingredient in ingredients:
+                name = str(ingredient.ingredient)
+                shopping_data[name] = shopping_data.get(
+                    name, 0) + ingredient.amount
+            content = ''
+            for name, amount in shopping_data.items():
+                content += f'{name} - {amount};\n'
+
+        self.measure('цикл в Python, txt', python_loop)
+        for file_format in ('txt', 'csv', 'json'):
+            self.measure(
+                f'готовые суммы, {file_format}',
+                lambda: b''.join(self.get(
+                    client,
+                    f'/api/recipes/download_shopping_cart/'
+                    f'?format={file_format}',
+                ).streaming_content),
+            )
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.tasks import render_avatar, render_recipe_image
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+def missing(queryset, field, renditions_field):
+    """id объектов, у которых нет копий текущей картинки."""
+    rows = queryset.exclude(**{field: ''}).exclude(
+        **{f'{field}__isnull': True})
+    for pk, name, renditions in rows.values_list(
+            'pk', field, renditions_field).iterator():
+        if (renditions or {}).get('source') != name:
+            yield pk
+
+
+class Command(BaseCommand):
+
+    help = 'Поставить в очередь уменьшение картинок без копий'
+
+    def handle(self, *args, **options):
+        recipes = users = 0
+        for recipe_id in missing(
+                Recipe.objects.all(), 'image', 'image_renditions'):
+            render_recipe_image.delay(recipe_id)
+            recipes += 1
+        for user_id in missing(User.objects.all(), 'avatar',
+                               'avatar_renditions'):
+            render_avatar.delay(user_id)
+            users += 1
+        self.stdout.write(
+            f'В очереди фото рецептов: {recipes}, аватаров: {users}')
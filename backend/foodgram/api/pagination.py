@@ -1,6 +1,148 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.feed import feed_recipe_ids
 
 
 class CustomPageNumberPagination(PageNumberPagination):
 
-    page_size_query_param = 'limit'
\ No newline at end of file
+    page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу сортировки.
+
+    Вместо OFFSET и COUNT(*) следующая страница выбирается условием
+    по значениям ключа последней записи, поэтому глубокие страницы
+    отдаются так же быстро, как первая.
+    """
+
+    ordering = ('-id',)
+    page_size = 6
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    @property
+    def fields(self):
+        """Поля ключа и признак сортировки по убыванию."""
+        return [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(
+                self.get_cursor_filter(queryset.model, encoded)
+            )
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, model, encoded):
+        """Значения ключа из курсора."""
+        try:
+            raw_values = json.loads(base64.urlsafe_b64decode(encoded))
+            return [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, raw_values,
+                                            strict=True)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_filter(self, model, encoded):
+        """Условие "строго после курсора" для составного ключа."""
+        values = self.decode_cursor(model, encoded)
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, instance):
+        values = [
+            instance._meta.get_field(name).value_to_string(instance)
+            for name, _ in self.fields
+        ]
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()
+        ).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class RecipeKeysetPagination(KeysetPagination):
+
+    ordering = ('-pub_date', '-id')
+
+
+class FeedKeysetPagination(RecipeKeysetPagination):
+    """Лента подписок: ключи страницы берутся из ленты пользователя.
+
+    Рецепты страницы выбираются из переданного кверисета по id.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        encoded = request.query_params.get(self.cursor_query_param)
+        after = (
+            self.decode_cursor(queryset.model, encoded) if encoded else None
+        )
+        ids = feed_recipe_ids(request, after, self.page_size + 1)
+        recipes = queryset.in_bulk(ids)
+        page = [recipes[recipe_id] for recipe_id in ids
+                if recipe_id in recipes]
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+
+class FollowKeysetPagination(KeysetPagination):
+
+    ordering = ('id',)
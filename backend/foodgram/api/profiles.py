@@ -0,0 +1,101 @@
+"""Кешированный профиль пользователя для ``/api/users/<id>/profile/``.
+
+Профиль собирается одним агрегирующим запросом по пользователю и
+одной выборкой рецептов и кешируется. Ключ включает версию профиля,
+которую обновляют новые рецепты, подписки и избранное, версию автора
+и версии справочников тегов и ингредиентов.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from api.cache import (FRAGMENT_TIMEOUT, INGREDIENTS_VERSION_KEY,
+                       TAGS_VERSION_KEY, author_version_key, get_versions,
+                       profile_version_key)
+from api.fast_serializers import serialize_recipe, serialize_user
+from api.querysets import get_recipe_queryset, load_recipe_relations
+from api.tag_registry import tag_registry
+from recipes.models import Follow, Recipe
+
+User = get_user_model()
+
+PROFILE_RECIPES = 5
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def build_profile(user_id):
+    """Собрать профиль или вернуть ``None``, если пользователя нет."""
+    user = User.objects.filter(id=user_id).annotate(
+        recipes_count=_count(Recipe.objects.all(), 'author'),
+        followers_count=_count(Follow.objects.all(), 'following'),
+        following_count=_count(Follow.objects.all(), 'user'),
+    ).first()
+    if user is None:
+        return None
+    own = Recipe.objects.filter(author_id=user_id)
+    recent_ids = own.order_by('-pub_date', '-id').values('id')
+    popular_ids = own.order_by('-favorite_count', '-id').values('id')
+    recipes = list(
+        get_recipe_queryset(AnonymousUser(), prefetch=False)
+        .filter(Q(id__in=recent_ids[:PROFILE_RECIPES])
+                | Q(id__in=popular_ids[:PROFILE_RECIPES]))
+    )
+    load_recipe_relations(recipes)
+    tags = tag_registry.get()
+    serialized = {
+        recipe.id: serialize_recipe(recipe, None, frozenset(), tags)
+        for recipe in recipes
+    }
+    recent = sorted(recipes, key=lambda recipe: (recipe.pub_date, recipe.id),
+                    reverse=True)
+    popular = sorted(recipes,
+                     key=lambda recipe: (recipe.favorite_count, recipe.id),
+                     reverse=True)
+    return {
+        'user': serialize_user(user, None, frozenset()),
+        'statistics': {
+            'recipes_count': user.recipes_count,
+            'followers_count': user.followers_count,
+            'following_count': user.following_count,
+            'is_subscribed': False,
+        },
+        'recent_recipes': [
+            serialized[recipe.id] for recipe in recent[:PROFILE_RECIPES]],
+        'popular_recipes': [
+            serialized[recipe.id] for recipe in popular[:PROFILE_RECIPES]],
+    }
+
+
+def get_profile(user_id):
+    """Профиль из кеша или ``None``, если пользователя нет."""
+    versions = get_versions([
+        profile_version_key(user_id),
+        author_version_key(user_id),
+        TAGS_VERSION_KEY,
+        INGREDIENTS_VERSION_KEY,
+    ])
+    key = 'profile:{}:{}:{}:{}:{}'.format(
+        user_id,
+        versions[profile_version_key(user_id)],
+        versions[author_version_key(user_id)],
+        versions[TAGS_VERSION_KEY],
+        versions[INGREDIENTS_VERSION_KEY],
+    )
+    profile = cache.get(key)
+    if profile is None:
+        profile = build_profile(user_id)
+        if profile is not None:
+            cache.set(key, profile, timeout=FRAGMENT_TIMEOUT)
+    return profile
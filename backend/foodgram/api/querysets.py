@@ -0,0 +1,127 @@
+from django.db import connection
+from django.db.models import (CharField, Count, Exists, F, IntegerField,
+                              OuterRef, Prefetch, Subquery, Value, Window,
+                              prefetch_related_objects)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+
+from recipes.models import (Favorite, IngredientRecipe, Recipe, ShoppingList,
+                            TagRecipe)
+
+RECIPE_PREFETCH = (
+    Prefetch(
+        'ingredientrecipe_set',
+        queryset=IngredientRecipe.objects.select_related('ingredient'),
+    ),
+)
+
+
+def _tag_ids_annotation():
+    """id тегов рецепта строкой через запятую прямо в запросе рецептов.
+
+    Сами теги берутся из ``api.tag_registry``, поэтому отдельный
+    запрос за тегами не нужен.
+    """
+    aggregate = (
+        "string_agg(tag_id::text, ',')"
+        if connection.vendor == 'postgresql' else 'group_concat(tag_id)'
+    )
+    return RawSQL(
+        f'SELECT {aggregate} FROM {TagRecipe._meta.db_table} '
+        f'WHERE recipe_id = {Recipe._meta.db_table}.id',
+        (),
+        output_field=CharField(),
+    )
+
+
+def load_recipe_relations(recipes):
+    """Подгрузить ингредиенты и id тегов для списка рецептов.
+
+    У рецептов без аннотации ``tag_ids_csv`` id тегов загружаются
+    одним запросом на весь список.
+    """
+    prefetch_related_objects(recipes, *RECIPE_PREFETCH)
+    missing = {}
+    for recipe in recipes:
+        if hasattr(recipe, 'tag_ids_csv'):
+            recipe.tag_ids = [
+                int(tag_id) for tag_id in (recipe.tag_ids_csv or '').split(',')
+                if tag_id
+            ]
+        else:
+            recipe.tag_ids = []
+            missing[recipe.id] = recipe
+    if missing:
+        relations = TagRecipe.objects.filter(
+            recipe_id__in=missing
+        ).values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in relations:
+            missing[recipe_id].tag_ids.append(tag_id)
+
+
+def get_recipe_queryset(user, prefetch=True):
+    """Кверисет рецептов для чтения.
+
+    Автор подтягивается join-ом, id тегов и флаги избранного и списка
+    покупок считаются подзапросами, ингредиенты - prefetch-запросом.
+    Число запросов не зависит от размера страницы. С ``prefetch=False``
+    ингредиенты подгружает сам сериализатор только для рецептов,
+    которых нет в кеше фрагментов.
+    """
+    queryset = Recipe.objects.select_related('author').annotate(
+        tag_ids_csv=_tag_ids_annotation(),
+    )
+    if prefetch:
+        queryset = queryset.prefetch_related(*RECIPE_PREFETCH)
+    if user.is_authenticated:
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingList.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+    return queryset.annotate(
+        is_favorited=Value(False),
+        is_in_shopping_cart=Value(False),
+    )
+
+
+def get_follow_queryset(user):
+    """Подписки пользователя с авторами и числом их рецептов.
+
+    Автор подтягивается join-ом, ``recipes_count`` считается
+    подзапросом - вся страница подписок читается одним запросом.
+    """
+    recipes_count = Recipe.objects.filter(
+        author=OuterRef('following_id')
+    ).order_by().values('author').annotate(total=Count('pk')).values('total')
+    return user.follower.select_related('following').annotate(
+        recipes_count=Coalesce(
+            Subquery(recipes_count, output_field=IntegerField()), 0),
+    )
+
+
+def latest_recipes_by_author(author_ids, limit=None):
+    """Последние рецепты каждого автора одним запросом.
+
+    Рецепты нумеруются ``ROW_NUMBER() OVER (PARTITION BY author)`` в
+    порядке публикации, и у каждого автора остаются первые ``limit``.
+    Возвращает ``{id автора: [рецепты]}``.
+    """
+    queryset = Recipe.objects.filter(author_id__in=author_ids).only(
+        'id', 'author_id', 'name', 'image', 'image_renditions',
+        'cooking_time')
+    if limit is not None:
+        queryset = queryset.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            ),
+        ).filter(row_number__lte=limit)
+    recipes = {author_id: [] for author_id in author_ids}
+    for recipe in queryset.order_by('author_id', '-pub_date', '-id'):
+        recipes[recipe.author_id].append(recipe)
+    return recipes
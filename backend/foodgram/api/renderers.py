@@ -0,0 +1,67 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    if orjson is not None else 0
+)
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """Типы, которые orjson не знает: Decimal, ленивые строки и т.п.
+
+    Даты тоже отдаются сюда, чтобы формат совпадал с DRF (``Z`` для
+    UTC).
+    """
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON-рендерер на orjson.
+
+    Вывод совпадает с ``JSONRenderer`` DRF. Без установленного orjson
+    и для форматированного вывода (``indent``) используется
+    стандартный ``json``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        # Как и DRF, экранируем U+2028 и U+2029 для совместимости с JS.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class PlainTextRenderer(BaseRenderer):
+    """Текстовые ответы, например список покупок в ``format=txt``."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """CSV-ответы, например список покупок в ``format=csv``."""
+
+    media_type = 'text/csv'
+    format = 'csv'
@@ -0,0 +1,78 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from recipes import fulltext
+
+POSTGRESQL_QUERY = (
+    "(websearch_to_tsquery('russian', %s)"
+    " || websearch_to_tsquery('english', %s))"
+)
+
+_fts_available = None
+
+
+def _sqlite_fts_available():
+    """Есть ли FTS5-индекс рецептов.
+
+    Проверяется один раз на процесс: недостающие после миграций
+    таблица и триггеры создаются заново.
+    """
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = fulltext.ensure_sqlite(connection)
+    return _fts_available
+
+
+def _fts5_query(search):
+    """Запрос FTS5 из пользовательской строки.
+
+    Каждое слово берётся в кавычки (спецсимволы FTS5 не
+    интерпретируются) и ищется по префиксу, что частично заменяет
+    отсутствующий в SQLite русский стемминг.
+    """
+    words = re.findall(r'\w+', search)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, search):
+    """Отфильтровать рецепты по строке поиска.
+
+    Добавляет аннотацию ``search_rank`` (больше - релевантнее). На
+    PostgreSQL используется ``search_vector`` с GIN-индексом, на SQLite
+    - FTS5, в остальных случаях - ``icontains`` без ранжирования.
+    """
+    if connection.vendor == 'postgresql':
+        params = (search, search)
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT id FROM {fulltext.TABLE} '
+            f'WHERE search_vector @@ {POSTGRESQL_QUERY}',
+            params,
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank_cd({fulltext.TABLE}.search_vector, '
+            f'{POSTGRESQL_QUERY})',
+            params,
+            output_field=FloatField(),
+        ))
+    if connection.vendor == 'sqlite' and _sqlite_fts_available():
+        query = _fts5_query(search)
+        if not query:
+            return queryset.none()
+        # Соединение с FTS5-таблицей: индекс просматривается один раз,
+        # а ранг берётся из той же строки совпадения.
+        return queryset.extra(
+            tables=[fulltext.FTS_TABLE],
+            where=[
+                f'{fulltext.FTS_TABLE}.rowid = {fulltext.TABLE}.id',
+                f'{fulltext.FTS_TABLE} MATCH %s',
+            ],
+            params=[query],
+            select={
+                'search_rank': f'-bm25({fulltext.FTS_TABLE}, 10.0, 1.0)',
+            },
+        )
+    return queryset.filter(
+        Q(name__icontains=search) | Q(text__icontains=search)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
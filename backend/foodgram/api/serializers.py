@@ -1,15 +1,24 @@
-import base64
 import re
 
-from django.core.files.base import ContentFile
+from django.db import models, transaction
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
 
+from api.cache import (bump_profile_version, bump_recipe_version,
+                       get_recipe_fragments)
+from api.fast_serializers import serialize_recipe, serialize_recipe_short
+from api.images import Base64ImageField, rendition_urls
+from api.querysets import latest_recipes_by_author, load_recipe_relations
+from api.statistics import schedule_refresh
+from api.tag_registry import tag_registry
+from recipes import cart_totals
 from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingList, Tag)
+                            Recipe, ShoppingList, Tag, TagRecipe)
 from users.models import User
 
+BULK_RECIPES_LIMIT = 100
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов."""
@@ -44,11 +53,30 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
 
 
+def get_subscribed_ids(request):
+    """Получить id авторов, на которых подписан пользователь запроса.
+
+    Подписки загружаются одним запросом и запоминаются на объекте
+    запроса, поэтому все сериализаторы ответа используют один набор.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return frozenset()
+    subscribed_ids = getattr(request, '_subscribed_ids', None)
+    if subscribed_ids is None:
+        subscribed_ids = frozenset(
+            user.follower.values_list('following_id', flat=True)
+        )
+        request._subscribed_ids = subscribed_ids
+    return subscribed_ids
+
+
 class CustomUserSerializer(UserSerializer):
     """Сериализатор пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.SerializerMethodField()
+    avatar_renditions = serializers.SerializerMethodField()
 
     class Meta:
         fields = (
@@ -59,14 +87,15 @@ class CustomUserSerializer(UserSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_renditions',
         )
         model = User
 
     def get_is_subscribed(self, obj):
         """Проверить подписку."""
-        user = self.context['request'].user
-        return user.is_authenticated and user.follower.filter(
-            following=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in get_subscribed_ids(self.context['request'])
 
     def get_avatar(self, obj):
         """Получить полный URL аватара."""
@@ -77,6 +106,11 @@ class CustomUserSerializer(UserSerializer):
             return obj.avatar.url
         return None
 
+    def get_avatar_renditions(self, obj):
+        """Ссылки на уменьшенные копии аватара."""
+        return rendition_urls(
+            obj.avatar, obj.avatar_renditions, self.context.get('request'))
+
 
 class IngredientRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов в рецепте для чтения."""
@@ -104,33 +138,106 @@ class IngredientRecipeWriteSerializer(serializers.Serializer):
     amount = serializers.IntegerField(min_value=1)
 
 
-class Base64ImageField(serializers.ImageField):
-    """Поле изображения."""
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления и удаления."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=BULK_RECIPES_LIMIT,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
 
-    def to_internal_value(self, data):
-        """Декодирует изображение."""
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов, собираемый из кеша фрагментов."""
 
-        return super().to_internal_value(data)
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        return self.child.to_representation_many(list(iterable))
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор рецепта."""
+    """Сериализатор рецепта.
+
+    Независящая от пользователя часть представления кешируется по
+    версии рецепта и автора, флаги пользователя подставляются при
+    каждом ответе.
+    """
 
     is_favorited = serializers.BooleanField(read_only=True)
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
-    tags = TagSerializer(many=True)
+    tags = serializers.SerializerMethodField()
     author = CustomUserSerializer()
     ingredients = IngredientRecipeSerializer(source='ingredientrecipe_set',
                                              many=True, read_only=True)
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'ingredient_count', 'favorite_count')
         model = Recipe
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        """Представление одного рецепта."""
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes):
+        """Собрать представления рецептов из фрагментов и флагов."""
+        if not all(hasattr(recipe, 'is_favorited')
+                   and hasattr(recipe, 'is_in_shopping_cart')
+                   for recipe in recipes):
+            fragments = self.build_fragments(recipes)
+            return [fragments[recipe.id] for recipe in recipes]
+        request = self.context['request']
+        fragments = get_recipe_fragments(
+            recipes, self.build_fragments, request
+        )
+        subscribed_ids = get_subscribed_ids(request)
+        data = []
+        for recipe in recipes:
+            representation = fragments[recipe.id].copy()
+            representation['is_favorited'] = bool(recipe.is_favorited)
+            representation['is_in_shopping_cart'] = bool(
+                recipe.is_in_shopping_cart)
+            representation['author'] = representation['author'].copy()
+            representation['author']['is_subscribed'] = getattr(
+                recipe.author, 'is_subscribed',
+                recipe.author_id in subscribed_ids,
+            )
+            data.append(representation)
+        return data
+
+    def get_tags(self, obj):
+        """Теги из справочника в памяти."""
+        return self.context['tags'].serialize(obj.tag_ids)
+
+    def get_image_renditions(self, obj):
+        """Ссылки на уменьшенные копии фото."""
+        return rendition_urls(
+            obj.image, obj.image_renditions, self.context.get('request'))
+
+    def build_fragments(self, recipes):
+        """Сериализовать рецепты полностью, подгрузив связи одним махом.
+
+        При ``fast_serialization`` в контексте словари строятся без
+        полей DRF, результат при этом тот же.
+        """
+        load_recipe_relations(recipes)
+        self.context['tags'] = tags = tag_registry.get()
+        fragments = {}
+        if self.context.get('fast_serialization'):
+            request = self.context['request']
+            subscribed_ids = get_subscribed_ids(request)
+            for recipe in recipes:
+                fragments[recipe.id] = serialize_recipe(
+                    recipe, request, subscribed_ids, tags)
+            return fragments
+        for recipe in recipes:
+            fragments[recipe.id] = super().to_representation(recipe)
+        return fragments
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -140,10 +247,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
     author = CustomUserSerializer(
         read_only=True, default=CurrentUserDefault())
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
     ingredients = IngredientRecipeWriteSerializer(
         many=True,
@@ -151,7 +255,8 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     )
 
     class Meta:
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'ingredient_count', 'favorite_count',
+                   'image_renditions')
         read_only_fields = (
             'author',
         )
@@ -175,8 +280,28 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         if len(ingredients_id_list) != len(set(ingredients_id_list)):
             raise serializers.ValidationError('Ингредиенты не должны '
                                               'повторяться.')
+        ingredient_ids = {
+            ingredient['id']
+            for ingredient in attrs.get('ingredientinrecipe_set', ())
+        }
+        missing = ingredient_ids - set(
+            Ingredient.objects.filter(id__in=ingredient_ids)
+            .values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                f'{", ".join(map(str, sorted(missing)))}.')
         return attrs
 
+    def validate_tags(self, value):
+        """Теги проверяются по справочнику без запросов к БД."""
+        missing = set(value) - tag_registry.get().by_id.keys()
+        if missing:
+            raise serializers.ValidationError(
+                f'Теги не найдены: {", ".join(map(str, sorted(missing)))}.')
+        return value
+
     def get_is_favorited(self, obj):
         """Проверить на избранное."""
         return Favorite.objects.filter(user=self.context['request'].user,
@@ -195,39 +320,117 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
         return serializer.data
 
-    def _add_ingredients(self, recipe, ingredients):
-        """Добавить список ингредиентов рецепта."""
-        data = []
-        for ingredient in ingredients:
-            data.append(IngredientRecipe(
-                recipe=recipe,
-                ingredient_id=ingredient['id'],
-                amount=ingredient['amount']
+    @staticmethod
+    def _amounts(ingredients):
+        return {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+
+    def _add_tags(self, recipe, tag_ids):
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag_id=tag_id) for tag_id in tag_ids)
+
+    def _add_ingredients(self, recipe, amounts):
+        """Добавить ингредиенты рецепта одним INSERT."""
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items()
+        )
+
+    def _update_tags(self, recipe, tag_ids):
+        """Применить к тегам рецепта только разницу. Вернуть, была ли она."""
+        old = set(TagRecipe.objects.filter(recipe=recipe)
+                  .values_list('tag_id', flat=True))
+        new = set(tag_ids)
+        if old - new:
+            TagRecipe.objects.filter(
+                recipe=recipe, tag_id__in=old - new).delete()
+        self._add_tags(recipe, new - old)
+        return old != new
+
+    def _update_ingredients(self, recipe, old, new):
+        """Применить к ингредиентам рецепта только разницу.
+
+        ``old`` и ``new`` - количества ``{id ингредиента: количество}``.
+        Удаление, изменение количеств и добавление - не больше чем по
+        одному запросу. Вернуть, была ли разница.
+        """
+        removed = old.keys() - new.keys()
+        changed = {
+            ingredient_id: amount for ingredient_id, amount in new.items()
+            if ingredient_id in old and old[ingredient_id] != amount
+        }
+        added = {
+            ingredient_id: amount for ingredient_id, amount in new.items()
+            if ingredient_id not in old
+        }
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        if changed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=changed,
+            ).update(amount=models.Case(
+                *(models.When(ingredient_id=ingredient_id,
+                              then=models.Value(amount))
+                  for ingredient_id, amount in changed.items()),
+                output_field=models.IntegerField(),
             ))
-        IngredientRecipe.objects.bulk_create(data)
+        if added:
+            self._add_ingredients(recipe, added)
+        return bool(removed or changed or added)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создание нового объекта."""
-        ingredients = validated_data.pop('ingredientinrecipe_set')
+        amounts = self._amounts(validated_data.pop('ingredientinrecipe_set'))
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
-        for tag in tags:
-            recipe.tags.add(tag)
-        self._add_ingredients(recipe, ingredients)
+        recipe = Recipe.objects.create(
+            **validated_data, ingredient_count=len(amounts))
+        self._add_tags(recipe, tags)
+        self._add_ingredients(recipe, amounts)
+        bump_recipe_version(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Редактирование объекта."""
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get('cooking_time',
-                                                   instance.cooking_time)
-        ingredients = validated_data.pop('ingredientinrecipe_set')
-        instance.tags.set(validated_data.pop('tags'))
-        instance.ingredients.clear()
-        instance.save()
-        self._add_ingredients(instance, ingredients)
+        """Редактирование объекта.
+
+        Сохраняются только изменённые поля, а теги и ингредиенты
+        сравниваются с текущими строками: правка без изменений ничего
+        не пишет в БД.
+        """
+        amounts = self._amounts(validated_data.pop('ingredientinrecipe_set'))
+        old_amounts = cart_totals.recipe_amounts(instance.id)
+        update_fields = [
+            field for field in ('name', 'text', 'cooking_time')
+            if field in validated_data
+            and validated_data[field] != getattr(instance, field)
+        ]
+        if 'image' in validated_data:
+            # Новый файл сохраняется всегда, хранилище само пропустит
+            # запись картинки, которая уже есть.
+            update_fields.append('image')
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        if instance.ingredient_count != len(amounts):
+            instance.ingredient_count = len(amounts)
+            update_fields.append('ingredient_count')
+        if update_fields:
+            instance.save(update_fields=update_fields)
+        tags_changed = self._update_tags(instance, validated_data.pop('tags'))
+        ingredients_changed = self._update_ingredients(
+            instance, old_amounts, amounts)
+        cart_totals.recipe_changed(instance.id, old_amounts, amounts)
+        if update_fields or tags_changed or ingredients_changed:
+            bump_recipe_version(instance.id)
+        if tags_changed or ingredients_changed:
+            # Сигналы рецепта срабатывают только при save(), а профиль
+            # автора и статистика показывают его теги и ингредиенты.
+            bump_profile_version(instance.author_id)
+            schedule_refresh()
         return instance
 
 
@@ -248,41 +451,44 @@ class FavoriteSerializer(serializers.ModelSerializer):
         )
         model = Favorite
 
-    def validate(self, data):
-        """Валидация данных."""
-        if (self.context['request'].method == "POST"
-                and Favorite.objects.filter(
-                    user=self.context['request'].user,
-                    recipe_id=self.context['recipe_id']
-        ).exists()):
-            raise serializers.ValidationError(
-                'Вы уже добавили в избранное!'
-            )
-        if (self.context['request'].method == "DELETE" and not
-            Favorite.objects.filter(
-                user=self.context['request'].user,
-                recipe_id=self.context['recipe_id']
-        ).exists()):
-            raise serializers.ValidationError(
-                'Этот рецепт не в избранном.'
-            )
-        return data
-
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Упрощённый сериализатор рецепта"""
     id = serializers.ReadOnlyField()
     name = serializers.ReadOnlyField()
     image = serializers.ImageField(read_only=True)
+    image_renditions = serializers.SerializerMethodField()
     cooking_time = serializers.ReadOnlyField()
 
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         model = Recipe
 
+    def get_image_renditions(self, obj):
+        """Ссылки на уменьшенные копии фото."""
+        return rendition_urls(
+            obj.image, obj.image_renditions, self.context.get('request'))
+
+
+class FollowListSerializer(serializers.ListSerializer):
+    """Список подписок с рецептами авторов, загруженными одним запросом."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        follows = list(iterable)
+        self.child.context['author_recipes'] = latest_recipes_by_author(
+            [follow.following_id for follow in follows],
+            self.child.get_recipes_limit(),
+        )
+        return super().to_representation(follows)
+
 
 class FollowSerializer(serializers.ModelSerializer):
-    """Сериализатор подписок."""
+    """Сериализатор подписок.
+
+    В списке рецепты авторов берутся из ``author_recipes`` контекста,
+    а ``recipes_count`` - из аннотации кверисета.
+    """
 
     email = serializers.ReadOnlyField(source='following.email')
     id = serializers.ReadOnlyField(source='following.id')
@@ -290,6 +496,7 @@ class FollowSerializer(serializers.ModelSerializer):
     first_name = serializers.ReadOnlyField(source='following.first_name')
     last_name = serializers.ReadOnlyField(source='following.last_name')
     avatar = serializers.SerializerMethodField()
+    avatar_renditions = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
@@ -302,36 +509,13 @@ class FollowSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'avatar',
+            'avatar_renditions',
             'is_subscribed',
             'recipes',
             'recipes_count',
         )
         model = Follow
-
-    def validate(self, data):
-        """Валидация данных."""
-        if self.context['request'].method == "POST" and Follow.objects.filter(
-                user=self.context['request'].user,
-                following_id=self.context['user_id']
-        ).exists():
-            raise serializers.ValidationError(
-                'Такая подписка уже есть.'
-            )
-        if (self.context['request'].method == "POST"
-                and self.context['request'].user.id
-                == self.context['user_id']):
-            raise serializers.ValidationError(
-                'На себя нельзя подписаться.'
-            )
-        if (self.context['request'].method == "DELETE" and not
-            Follow.objects.filter(
-                user=self.context['request'].user,
-                following_id=self.context['user_id']
-        ).exists()):
-            raise serializers.ValidationError(
-                'Такой подписки нет.'
-            )
-        return data
+        list_serializer_class = FollowListSerializer
 
     def get_avatar(self, obj):
         """Получить полный URL аватара."""
@@ -342,24 +526,42 @@ class FollowSerializer(serializers.ModelSerializer):
             return obj.following.avatar.url
         return None
 
-    def get_recipes(self, obj):
-        """Получить связанные рецепты."""
+    def get_avatar_renditions(self, obj):
+        """Ссылки на уменьшенные копии аватара."""
+        return rendition_urls(
+            obj.following.avatar, obj.following.avatar_renditions,
+            self.context.get('request'))
+
+    def get_recipes_limit(self):
         recipes_limit = self.context['request'].query_params.get(
             'recipes_limit'
         )
-        queryset = obj.following.recipes.all()
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
+        return int(recipes_limit) if recipes_limit else None
+
+    def get_recipes(self, obj):
+        """Получить связанные рецепты."""
+        author_recipes = self.context.get('author_recipes')
+        if author_recipes is not None:
+            queryset = author_recipes[obj.following_id]
+        else:
+            queryset = obj.following.recipes.all()
+            recipes_limit = self.get_recipes_limit()
+            if recipes_limit is not None:
+                queryset = queryset[:recipes_limit]
+        if self.context.get('fast_serialization'):
+            return [serialize_recipe_short(recipe) for recipe in queryset]
         serializer = RecipeShortSerializer(queryset, many=True)
         return serializer.data
 
     def get_is_subscribed(self, obj):
         """Проверить подписку."""
-        return Follow.objects.filter(user=self.context['request'].user,
-                                     following=obj.following).exists()
+        return obj.following_id in get_subscribed_ids(
+            self.context['request'])
 
     def get_recipes_count(self, obj):
         """Получить счетчит рецептов."""
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.following.recipes.count()
 
 
@@ -373,24 +575,4 @@ class ShoppingCardSerializer(serializers.ModelSerializer):
 
     class Meta:
         fields = ('id', 'name', 'image', 'cooking_time')
-        model = ShoppingList
-
-    def validate(self, data):
-        """Валидация данных."""
-        if (self.context['request'].method == "POST"
-                and ShoppingList.objects.filter(
-                    user=self.context['request'].user,
-                    recipe_id=self.context['recipe_id']
-        ).exists()):
-            raise serializers.ValidationError(
-                'Уже добавлен в список покупок.'
-            )
-        if (self.context['request'].method == "DELETE" and not
-            ShoppingList.objects.filter(
-                user=self.context['request'].user,
-                recipe_id=self.context['recipe_id']
-        ).exists()):
-            raise serializers.ValidationError(
-                'Этого рецепта нет в списке покупок.'
-            )
-        return data
\ No newline at end of file
+        model = ShoppingList
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""Список покупок: суммы ингредиентов и выгрузка файлом.
+
+Суммы хранятся готовыми в ``ShoppingCartIngredient``, а файл
+отдаётся построчно, без сборки всего содержимого в памяти.
+"""
+import csv
+import io
+
+from django.db.models import F
+
+from api.renderers import FastJSONRenderer
+from recipes.models import ShoppingCartIngredient
+
+CHUNK_SIZE = 500
+
+
+def shopping_cart_totals(user):
+    """Суммы ингредиентов по рецептам из списка покупок пользователя.
+
+    Читаются из поддерживаемой таблицы ``ShoppingCartIngredient``.
+    """
+    return (
+        ShoppingCartIngredient.objects
+        .filter(user=user)
+        .values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            total=F('amount'),
+        )
+        .order_by('name', 'measurement_unit')
+    )
+
+
+def iter_txt(rows):
+    for row in rows:
+        yield f'{row["name"]}, {row["measurement_unit"]} - {row["total"]};\n'
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        writer.writerow((row['name'], row['measurement_unit'], row['total']))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_json(rows):
+    renderer = FastJSONRenderer()
+    separator = b'['
+    for row in rows:
+        yield separator + renderer.render({
+            'name': row['name'],
+            'measurement_unit': row['measurement_unit'],
+            'amount': row['total'],
+        })
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
+
+
+WRITERS = {
+    'txt': iter_txt,
+    'csv': iter_csv,
+    'json': iter_json,
+}
+
+
+def iter_shopping_cart(user, file_format):
+    """Части файла списка покупок в формате ``txt``, ``csv`` или ``json``."""
+    rows = shopping_cart_totals(user).iterator(chunk_size=CHUNK_SIZE)
+    return WRITERS[file_format](rows)
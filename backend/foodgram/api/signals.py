@@ -0,0 +1,206 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import forget_tokens, forget_user
+from api.cache import (INGREDIENTS_VERSION_KEY, RECIPES_VERSION_KEY,
+                       TAGS_VERSION_KEY, bump_author_version,
+                       bump_profile_version, bump_recipe_version,
+                       bump_version)
+from api.images import delete_renditions
+from api.statistics import schedule_refresh
+from api.tasks import (backfill_feed, fan_out_recipe, render_avatar,
+                       render_recipe_image)
+from recipes import cart_totals, feed, storage
+from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingList, Tag, TagRecipe)
+
+User = get_user_model()
+
+FILE_FIELDS = {
+    Recipe: ('image',),
+    User: ('avatar',),
+}
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """Рецепт изменён или удалён, в том числе из админки."""
+    bump_recipe_version(instance.id)
+
+
+@receiver((post_save, post_delete), sender=TagRecipe)
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_relation_changed(sender, instance, **kwargs):
+    """Изменены теги или ингредиенты рецепта через админку."""
+    bump_recipe_version(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version(TAGS_VERSION_KEY, RECIPES_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_version(INGREDIENTS_VERSION_KEY, RECIPES_VERSION_KEY)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_cascade_deleted(sender, instance, origin=None, **kwargs):
+    """Избранное удалено каскадом, например вместе с пользователем.
+
+    Прямое удаление из избранного уменьшает счётчик в представлении.
+    """
+    if isinstance(origin, QuerySet):
+        origin = origin.model
+    if origin in (Favorite, Recipe) or isinstance(origin, (Favorite, Recipe)):
+        return
+    Recipe.objects.filter(id=instance.recipe_id).update(
+        favorite_count=F('favorite_count') - 1)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingList)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=TagRecipe)
+@receiver(post_delete, sender=User)
+def statistics_changed(sender, **kwargs):
+    """Данные статистики изменились - пересчитать снимок."""
+    schedule_refresh()
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, created, **kwargs):
+    if created:
+        schedule_refresh()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def author_profile_changed(sender, instance, **kwargs):
+    bump_profile_version(instance.author_id)
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    """Подписка меняет счётчики обоих профилей."""
+    bump_profile_version(instance.user_id, instance.following_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, raw=False, **kwargs):
+    """Новый рецепт попадает в ленты подписчиков после фиксации."""
+    if created and not raw:
+        recipe_id = instance.id
+        transaction.on_commit(lambda: fan_out_recipe.delay(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, raw=False, **kwargs):
+    """Новое фото рецепта уменьшается задачей после фиксации."""
+    image = instance.image
+    if raw or not image or (
+            instance.image_renditions.get('source') == image.name):
+        return
+    recipe_id = instance.id
+    transaction.on_commit(lambda: render_recipe_image.delay(recipe_id))
+
+
+@receiver(post_save, sender=User)
+def avatar_saved(sender, instance, raw=False, **kwargs):
+    """Новый аватар уменьшается задачей после фиксации."""
+    avatar = instance.avatar
+    if raw or not avatar or (
+            (instance.avatar_renditions or {}).get('source') == avatar.name):
+        return
+    user_id = instance.id
+    transaction.on_commit(lambda: render_avatar.delay(user_id))
+
+
+@receiver(post_init, sender=Recipe)
+@receiver(post_init, sender=User)
+def files_loaded(sender, instance, **kwargs):
+    """Запомнить файлы, чтобы освободить их при замене."""
+    storage.remember(instance, FILE_FIELDS[sender])
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def files_saving(sender, instance, **kwargs):
+    storage.mark_pending(instance, FILE_FIELDS[sender])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def files_saved(sender, instance, **kwargs):
+    """Заменённый файл теряет ссылку из этого объекта."""
+    storage.release_replaced(instance, FILE_FIELDS[sender])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_files_deleted(sender, instance, **kwargs):
+    storage.release([instance.image.name])
+    delete_renditions(instance.image_renditions)
+
+
+@receiver(post_delete, sender=User)
+def avatar_deleted(sender, instance, **kwargs):
+    storage.release([instance.avatar.name])
+    delete_renditions(instance.avatar_renditions)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход через djoser или удаление пользователя."""
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Смена пароля, деактивация и правка профиля сбрасывают кеш токенов
+    и фрагменты рецептов и профилей с данными автора.
+
+    Обновление ``last_login`` при входе кеши не трогает.
+    """
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    forget_user(instance.id)
+    bump_author_version(instance.id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    """Подписка добавляет в ленту последние рецепты автора."""
+    if created and not raw:
+        user_id, author_id = instance.user_id, instance.following_id
+        transaction.on_commit(
+            lambda: backfill_feed.delay(user_id, author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Отписка убирает рецепты автора из ленты."""
+    feed.prune(instance.user_id, instance.following_id)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    """Избранное меняет популярные рецепты в профиле автора."""
+    if Favorite.recipe.is_cached(instance):
+        author_ids = [instance.recipe.author_id]
+    else:
+        author_ids = Recipe.objects.filter(
+            id=instance.recipe_id).values_list('author_id', flat=True)
+    bump_profile_version(*author_ids)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted_from_carts(sender, instance, **kwargs):
+    """Вычесть ингредиенты удаляемого рецепта из списков покупок."""
+    cart_totals.recipe_changed(
+        instance.id, cart_totals.recipe_amounts(instance.id), {})
@@ -0,0 +1,72 @@
+"""Готовые ответы, общие для всех пользователей.
+
+Снимки статистики и профилей хранятся в кеше без данных конкретного
+пользователя и с относительными ссылками на файлы. Перед выдачей в них
+подставляются признаки избранного, списка покупок и подписки, а ссылки
+становятся абсолютными.
+"""
+from recipes.models import Favorite, ShoppingList
+
+
+def absolute_url(request, url):
+    return request.build_absolute_uri(url) if url else None
+
+
+def absolute_urls(request, urls):
+    if urls is None:
+        return None
+    return {name: absolute_url(request, url) for name, url in urls.items()}
+
+
+def personalize_user(user, request, subscribed_ids):
+    return {
+        **user,
+        'is_subscribed': user['id'] in subscribed_ids,
+        'avatar': absolute_url(request, user['avatar']),
+        'avatar_renditions': absolute_urls(
+            request, user['avatar_renditions']),
+    }
+
+
+def _personalize_recipe(recipe, request, favorited, in_cart, subscribed):
+    return {
+        **recipe,
+        'is_favorited': recipe['id'] in favorited,
+        'is_in_shopping_cart': recipe['id'] in in_cart,
+        'author': personalize_user(recipe['author'], request, subscribed),
+        'image': absolute_url(request, recipe['image']),
+        'image_renditions': absolute_urls(
+            request, recipe['image_renditions']),
+    }
+
+
+def personalize(snapshot, request, subscribed_ids):
+    """Подставить данные пользователя в рецепты снимка.
+
+    Рецепты берутся из ключей ``popular_recipes`` и ``recent_recipes``.
+    """
+    recipe_ids = {
+        recipe['id']
+        for recipe in snapshot['popular_recipes'] + snapshot['recent_recipes']
+    }
+    favorited = in_cart = frozenset()
+    if request.user.is_authenticated and recipe_ids:
+        favorited = set(Favorite.objects.filter(
+            user=request.user, recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', flat=True))
+        in_cart = set(ShoppingList.objects.filter(
+            user=request.user, recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', flat=True))
+    return {
+        **snapshot,
+        'popular_recipes': [
+            _personalize_recipe(
+                recipe, request, favorited, in_cart, subscribed_ids)
+            for recipe in snapshot['popular_recipes']
+        ],
+        'recent_recipes': [
+            _personalize_recipe(
+                recipe, request, favorited, in_cart, subscribed_ids)
+            for recipe in snapshot['recent_recipes']
+        ],
+    }
@@ -0,0 +1,135 @@
+"""Снимок статистики для ``/api/statistics/``.
+
+Статистика считается целиком (задачей Celery по расписанию и после
+изменений данных) и хранится в кеше. Снимок не зависит от
+пользователя: ссылки на файлы в нём относительные, а признаки
+избранного, списка покупок и подписки подставляются при выдаче.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+from django.utils import timezone
+
+from api.fast_serializers import serialize_recipe
+from api.querysets import get_recipe_queryset, load_recipe_relations
+from api.tag_registry import tag_registry
+from recipes.models import Favorite, Recipe, ShoppingList, Tag
+
+User = get_user_model()
+
+SNAPSHOT_KEY = 'statistics:snapshot'
+REFRESH_SCHEDULED_KEY = 'statistics:refresh:scheduled'
+
+
+def _serialize_recipes(queryset):
+    recipes = list(queryset)
+    load_recipe_relations(recipes)
+    tags = tag_registry.get()
+    return [
+        serialize_recipe(recipe, None, frozenset(), tags)
+        for recipe in recipes
+    ]
+
+
+def build_statistics():
+    """Посчитать статистику по всей базе."""
+    week_ago = timezone.now() - timedelta(days=7)
+    recipe_stats = Recipe.objects.aggregate(
+        total=Count('id'),
+        avg_cooking_time=Avg('cooking_time'),
+        avg_ingredients=Avg('ingredient_count'),
+    )
+    recipes = get_recipe_queryset(AnonymousUser(), prefetch=False)
+    tag_stats = Tag.objects.annotate(
+        recipe_count=Count('recipe')
+    ).order_by('-recipe_count')[:10]
+    # Сумма денормализованных счётчиков вместо соединения
+    # рецептов с избранным.
+    author_stats = User.objects.annotate(
+        recipe_count=Count('recipes'),
+        total_favorites=Sum('recipes__favorite_count'),
+    ).filter(recipe_count__gt=0).order_by('-recipe_count')[:10]
+    avg_cooking_time = recipe_stats['avg_cooking_time']
+    avg_ingredients = recipe_stats['avg_ingredients']
+    return {
+        'overall_statistics': {
+            'total_recipes': recipe_stats['total'],
+            'total_users': User.objects.count(),
+            'total_favorites': Favorite.objects.count(),
+            'total_shopping_lists': ShoppingList.objects.count(),
+            'new_recipes_week': Recipe.objects.filter(
+                pub_date__gte=week_ago).count(),
+            'new_users_week': User.objects.filter(
+                date_joined__gte=week_ago).count(),
+            'avg_cooking_time': (
+                round(avg_cooking_time, 1) if avg_cooking_time else 0),
+            'avg_ingredients_per_recipe': (
+                round(avg_ingredients, 1) if avg_ingredients else 0),
+        },
+        'popular_recipes': _serialize_recipes(
+            recipes.order_by('-favorite_count')[:10]),
+        'recent_recipes': _serialize_recipes(
+            recipes.order_by('-pub_date')[:10]),
+        'top_tags': [
+            {
+                'id': tag.id,
+                'name': tag.name,
+                'color': tag.color,
+                'slug': tag.slug,
+                'recipe_count': tag.recipe_count,
+            }
+            for tag in tag_stats
+        ],
+        'top_authors': [
+            {
+                'id': author.id,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+                'recipe_count': author.recipe_count,
+                'total_favorites': author.total_favorites,
+            }
+            for author in author_stats
+        ],
+        'generated_at': timezone.now(),
+    }
+
+
+def refresh_snapshot():
+    """Пересчитать и сохранить снимок."""
+    snapshot = build_statistics()
+    cache.set(SNAPSHOT_KEY, snapshot, timeout=None)
+    return snapshot
+
+
+def get_snapshot(fresh=False):
+    """Снимок из кеша; при его отсутствии считается сразу."""
+    snapshot = None if fresh else cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        snapshot = refresh_snapshot()
+    return snapshot
+
+
+def schedule_refresh():
+    """Запланировать пересчёт после фиксации транзакции.
+
+    Изменения за ``STATISTICS_REFRESH_DELAY`` секунд собираются в один
+    пересчёт. Когда задачи Celery выполняются сразу, пересчёт занял бы
+    запрос с изменением, поэтому снимок только удаляется и считается
+    заново при следующем чтении статистики.
+    """
+    def enqueue():
+        if settings.CELERY_TASK_ALWAYS_EAGER:
+            cache.delete(SNAPSHOT_KEY)
+            return
+        delay = settings.STATISTICS_REFRESH_DELAY
+        if cache.add(REFRESH_SCHEDULED_KEY, True, timeout=delay):
+            from api.tasks import refresh_statistics_snapshot
+            refresh_statistics_snapshot.apply_async(countdown=delay)
+
+    transaction.on_commit(enqueue)
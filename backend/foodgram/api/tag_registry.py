@@ -0,0 +1,47 @@
+"""Справочник тегов в памяти процесса.
+
+Теги меняются редко, а нужны почти в каждом ответе: в списке тегов,
+во вложенных тегах рецептов и в фильтре по слагам. Справочник
+загружается одним запросом и пересобирается при смене версии
+``TAGS_VERSION_KEY``, которую обновляют сигналы модели ``Tag``.
+"""
+from api.cache import TAGS_VERSION_KEY, LocalVersionedValue
+from recipes.models import Tag
+
+
+class TagRegistry:
+    """Теги в виде готовых представлений."""
+
+    def __init__(self, tags):
+        self.items = [
+            {
+                'id': tag.id,
+                'name': tag.name,
+                'color': tag.color,
+                'slug': tag.slug,
+            }
+            for tag in tags
+        ]
+        self.by_id = {item['id']: item for item in self.items}
+        self.ids_by_slug = {item['slug']: item['id'] for item in self.items}
+
+    def serialize(self, tag_ids):
+        """Представления тегов по id в порядке справочника."""
+        return [
+            self.by_id[tag_id] for tag_id in sorted(tag_ids)
+            if tag_id in self.by_id
+        ]
+
+    def ids_for_slugs(self, slugs):
+        return [
+            self.ids_by_slug[slug] for slug in slugs
+            if slug in self.ids_by_slug
+        ]
+
+    def choices(self):
+        return [(item['slug'], item['slug']) for item in self.items]
+
+
+tag_registry = LocalVersionedValue(
+    TAGS_VERSION_KEY, lambda: TagRegistry(Tag.objects.order_by('id'))
+)
@@ -0,0 +1,54 @@
+from celery import shared_task
+from django.contrib.auth import get_user_model
+
+from api.cache import bump_author_version, bump_recipe_version
+from api.images import update_renditions
+from api.statistics import refresh_snapshot
+from recipes import feed, storage
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+@shared_task
+def refresh_statistics_snapshot():
+    """Пересчитать снимок статистики."""
+    refresh_snapshot()
+
+
+@shared_task
+def fan_out_recipe(recipe_id):
+    """Разложить новый рецепт по лентам подписчиков."""
+    feed.recipe_created(recipe_id)
+
+
+@shared_task
+def backfill_feed(user_id, author_id):
+    """Добавить в ленту рецепты автора, на которого подписались."""
+    feed.backfill(user_id, author_id)
+
+
+@shared_task
+def refresh_feed_pull_authors():
+    """Пересчитать авторов, рецепты которых подмешиваются при чтении."""
+    feed.refresh_pull_authors()
+
+
+@shared_task
+def render_recipe_image(recipe_id):
+    """Сделать уменьшенные копии фото рецепта."""
+    if update_renditions(Recipe, recipe_id, 'image', 'image_renditions'):
+        bump_recipe_version(recipe_id)
+
+
+@shared_task
+def render_avatar(user_id):
+    """Сделать уменьшенные копии аватара."""
+    if update_renditions(User, user_id, 'avatar', 'avatar_renditions'):
+        bump_author_version(user_id)
+
+
+@shared_task
+def collect_media_garbage():
+    """Удалить медиафайлы, на которые больше нет ссылок."""
+    storage.collect_garbage()
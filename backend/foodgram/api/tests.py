@@ -1,3 +1,1527 @@
-from django.test import TestCase
+import base64
+import datetime
+import decimal
+import io
+import json
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import search, statistics
+from api.authentication import (CachedTokenAuthentication, local_tokens,
+                                token_cache_key)
+from api.checks import check_shared_cache, check_task_broker
+from api.images import RENDITION_FORMAT, RENDITIONS, update_renditions
+from api.ingredient_index import ingredient_index
+from api.parsers import FastJSONParser
+from api.querysets import get_recipe_queryset
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeSerializer
+from api.tag_registry import tag_registry
+from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+from recipes import fulltext
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient,
+                            IngredientRecipe, MediaBlob, Recipe,
+                            ShoppingCartIngredient, Tag, TagRecipe)
+from recipes.storage import collect_garbage, collect_untracked
+from users.models import User
+
+
+class RecipeFixturesMixin:
+    """Общие данные для тестов рецептов."""
+
+    @classmethod
+    def create_user(cls, username):
+        return User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            password='password',
+            first_name=username,
+            last_name=username,
+        )
+
+    @classmethod
+    def create_recipes(cls, author, count, tags, ingredients, prefix='r'):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                name=f'{prefix}-{author.username}-{index}',
+                author=author,
+                image='backend-media/recipes/images/test.png',
+                text='text',
+                cooking_time=10,
+            )
+            for index in range(count)
+        )
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in tags
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=2)
+            for recipe in recipes for ingredient in ingredients
+        )
+        return recipes
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('reader')
+        cls.tags = [
+            Tag.objects.create(
+                name=f'tag{index}', color=f'#00000{index}',
+                slug=f'tag{index}',
+            )
+            for index in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient{index}', measurement_unit='г',
+            )
+            for index in range(3)
+        ]
+        cls.authors = [cls.create_user(f'author{index}') for index in range(4)]
+        cls.recipes = []
+        for author in cls.authors:
+            cls.recipes += cls.create_recipes(
+                author, 25, cls.tags, cls.ingredients,
+            )
+        Follow.objects.create(user=cls.user, following=cls.authors[0])
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeQueryCountTest(RecipeFixturesMixin, TestCase):
+    """Число запросов к БД на страницу рецептов."""
+
+    def setUp(self):
+        super().setUp()
+        tag_registry.get()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_list_query_count_does_not_depend_on_limit(self):
+        counts = {
+            limit: self.count_queries(f'/api/recipes/?limit={limit}')
+            for limit in (1, 10, 100)
+        }
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_anonymous_list_query_count_does_not_depend_on_limit(self):
+        self.client.force_authenticate(None)
+        counts = {
+            limit: self.count_queries(f'/api/recipes/?limit={limit}')
+            for limit in (1, 100)
+        }
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_retrieve_query_count(self):
+        recipe = self.recipes[0]
+        # Рецепт с id тегов, подписки и ингредиенты.
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+        self.assertEqual(len(response.data['ingredients']), 3)
+
+    def test_subscriptions_query_count(self):
+        url = '/api/users/subscriptions/?limit=10&recipes_limit=2'
+        # Подписки, число подписок, рецепты авторов и id подписок.
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        for author in self.authors[1:]:
+            Follow.objects.create(user=self.user, following=author)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.data['count'], 4)
+        for author, data in zip(self.authors, response.data['results']):
+            expected = list(
+                author.recipes.values_list('id', flat=True)[:2])
+            self.assertEqual(data['id'], author.id)
+            self.assertEqual(
+                [recipe['id'] for recipe in data['recipes']], expected)
+            self.assertEqual(data['recipes_count'], 25)
+            self.assertTrue(data['is_subscribed'])
+
+    def test_subscriptions_without_recipes_limit(self):
+        response = self.client.get('/api/users/subscriptions/?limit=10')
+        self.assertEqual(len(response.data['results'][0]['recipes']), 25)
+
+    def edit_payload(self, recipe, **changes):
+        payload = {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 2}
+                for ingredient in self.ingredients
+            ],
+        }
+        payload.update(changes)
+        return payload
+
+    def test_noop_edit_query_count(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(id=recipe.id).update(ingredient_count=3)
+        self.client.force_authenticate(self.authors[0])
+        url = f'/api/recipes/{recipe.id}/'
+        # Рецепт, проверка уникальности названия, id ингредиентов,
+        # текущие ингредиенты и теги, транзакция и ответ из двух запросов.
+        with CaptureQueriesContext(connection) as context:
+            with self.assertNumQueries(9):
+                response = self.client.patch(
+                    url, self.edit_payload(recipe), format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        writes = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
+
+    def test_edit_applies_only_difference(self):
+        recipe = self.recipes[0]
+        self.client.force_authenticate(self.authors[0])
+        kept = IngredientRecipe.objects.get(
+            recipe=recipe, ingredient=self.ingredients[1])
+        payload = self.edit_payload(
+            recipe, tags=[self.tags[0].id], ingredients=[
+                {'id': self.ingredients[0].id, 'amount': 5},
+                {'id': self.ingredients[1].id, 'amount': 2},
+            ])
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            dict(recipe.ingredientrecipe_set.values_list(
+                'ingredient_id', 'amount')),
+            {self.ingredients[0].id: 5, self.ingredients[1].id: 2},
+        )
+        self.assertTrue(IngredientRecipe.objects.filter(id=kept.id).exists())
+        self.assertEqual(
+            list(recipe.tags.values_list('id', flat=True)), [self.tags[0].id])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_count, 2)
+
+    def test_edit_rejects_unknown_ids(self):
+        recipe = self.recipes[0]
+        self.client.force_authenticate(self.authors[0])
+        for payload in (
+            self.edit_payload(recipe, tags=[10 ** 6]),
+            self.edit_payload(
+                recipe, ingredients=[{'id': 10 ** 6, 'amount': 1}]),
+        ):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', payload, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTest(RecipeFixturesMixin, TestCase):
+    """Пагинация по ключу."""
+
+    def test_cursor_pages_match_offset_order(self):
+        expected = list(
+            Recipe.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        )
+        seen = []
+        url = '/api/recipes/?pagination=cursor&limit=7'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=broken')
+        self.assertEqual(response.status_code, 404)
+
+    def test_subscriptions_cursor(self):
+        for author in self.authors[1:]:
+            Follow.objects.create(user=self.user, following=author)
+        response = self.client.get(
+            '/api/users/subscriptions/?pagination=cursor&limit=3'
+        )
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [author['id'] for author in response.data['results']],
+            [self.authors[3].id],
+        )
+        self.assertIsNone(response.data['next'])
+
+
+class RecipeFragmentCacheTest(RecipeFixturesMixin, TestCase):
+    """Кеш фрагментов рецептов."""
+
+    def test_warm_cache_skips_related_queries(self):
+        url = '/api/recipes/?limit=10'
+        cold = self.client.get(url)
+        with self.assertNumQueries(3):
+            warm = self.client.get(url)
+        self.assertEqual(cold.data, warm.data)
+
+    def test_user_flags_are_not_shared(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.assertTrue(self.client.get(url).data['is_favorited'])
+        self.client.force_authenticate(self.authors[1])
+        response = self.client.get(url)
+        self.assertFalse(response.data['is_favorited'])
+        self.assertFalse(response.data['author']['is_subscribed'])
+
+    def test_author_update_invalidates_fragment(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.client.get(url)
+        self.client.force_authenticate(self.authors[0])
+        response = self.client.patch(
+            f'/api/users/{self.authors[0].id}/', {'first_name': 'Новое'}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.data['author']['first_name'], 'Новое')
+
+    def test_author_save_outside_api_invalidates_fragment(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.client.get(url)
+        author = User.objects.get(id=self.authors[0].id)
+        author.first_name = 'Из админки'
+        author.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['author']['first_name'], 'Из админки')
+
+
+class FastSerializationTest(RecipeFixturesMixin, TestCase):
+    """Быстрый путь сериализации."""
+
+    def render(self, fast):
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = self.user
+        recipes = list(get_recipe_queryset(self.user))
+        serializer = RecipeSerializer(context={
+            'request': request, 'fast_serialization': fast,
+        })
+        fragments = serializer.build_fragments(recipes)
+        return JSONRenderer().render(list(fragments.values()))
+
+    def test_output_is_byte_identical(self):
+        author = self.authors[0]
+        author.avatar = 'users/avatar.png'
+        author.save()
+        self.assertEqual(self.render(fast=True), self.render(fast=False))
+
+
+class FastJSONRendererTest(TestCase):
+    """Рендерер и парсер на orjson."""
+
+    data = {
+        'decimal': decimal.Decimal('1.50'),
+        'datetime': datetime.datetime(2024, 1, 2, 3, 4, 5, 678901,
+                                      tzinfo=datetime.timezone.utc),
+        'date': datetime.date(2024, 1, 2),
+        'lazy': gettext_lazy('Рецепт'),
+        'separator': 'a\u2028b',
+        1: [None, True, 'текст'],
+    }
+
+    def test_output_matches_drf_renderer(self):
+        self.assertEqual(
+            FastJSONRenderer().render(self.data),
+            JSONRenderer().render(self.data),
+        )
+
+    def test_indent_falls_back_to_stdlib(self):
+        self.assertEqual(
+            FastJSONRenderer().render(self.data, 'application/json; indent=2'),
+            JSONRenderer().render(self.data, 'application/json; indent=2'),
+        )
+
+    def test_parser_round_trip(self):
+        stream = io.BytesIO(FastJSONRenderer().render(
+            {'now': timezone.now(), 'name': 'борщ'}
+        ))
+        self.assertEqual(
+            FastJSONParser().parse(stream)['name'], 'борщ'
+        )
+
+
+class ConditionalGetTest(RecipeFixturesMixin, TestCase):
+    """Условные GET-запросы."""
+
+    def assert_not_modified(self, viewset, url, **headers):
+        with mock.patch.object(viewset, 'get_serializer') as serializer, \
+                self.assertNumQueries(0):
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        serializer.assert_not_called()
+        return response
+
+    def test_recipes_if_none_match(self):
+        url = '/api/recipes/?limit=5'
+        etag = self.client.get(url)['ETag']
+        response = self.assert_not_modified(
+            RecipeViewSet, url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_user_state_change_invalidates_etag(self):
+        url = '/api/recipes/?limit=5'
+        etag = self.client.get(url)['ETag']
+        self.client.post(f'/api/recipes/{self.recipes[5].id}/favorite/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_user(self):
+        url = '/api/recipes/?limit=5'
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(self.authors[0])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_tags_if_none_match_and_tag_change(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        self.assert_not_modified(TagViewSet, '/api/tags/',
+                                 HTTP_IF_NONE_MATCH=etag)
+        Tag.objects.create(name='new', color='#FFFFFF', slug='new')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_ingredients_if_modified_since(self):
+        url = f'/api/ingredients/{self.ingredients[0].id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assert_not_modified(IngredientViewSet, url,
+                                 HTTP_IF_MODIFIED_SINCE=last_modified)
+
+
+class RecipeSearchTest(RecipeFixturesMixin, TestCase):
+    """Полнотекстовый поиск рецептов."""
+
+    def test_relevance_ordering(self):
+        author = self.authors[0]
+        in_text = Recipe.objects.create(
+            name='Пампушки', author=author, image='x.png', cooking_time=5,
+            text='Подаются к борщу со сметаной.',
+        )
+        in_name = Recipe.objects.create(
+            name='Борщ украинский', author=author, image='x.png',
+            cooking_time=60, text='Свекла, капуста, картофель.',
+        )
+        Recipe.objects.create(
+            name='Cooking pancakes', author=author, image='x.png',
+            cooking_time=15, text='Flour and milk.',
+        )
+        response = self.client.get(
+            '/api/recipes-filter/?search=борщ&sort_by=relevance'
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [in_name.id, in_text.id],
+        )
+
+    def test_english_stemming_and_updates(self):
+        recipe = self.recipes[0]
+        recipe.name = 'Cooking pancakes'
+        recipe.save()
+        response = self.client.get('/api/recipes-filter/?search=cook')
+        self.assertEqual(response.data['count'], 1)
+        recipe.delete()
+        response = self.client.get('/api/recipes-filter/?search=cook')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_missing_sqlite_triggers_are_restored(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5-триггеры есть только на SQLite')
+        with connection.cursor() as cursor:
+            for trigger in fulltext.SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+        with mock.patch.object(search, '_fts_available', None):
+            self.client.get('/api/recipes-filter/?search=cook')
+            recipe = self.recipes[0]
+            recipe.name = 'Cooking pancakes'
+            recipe.save()
+            response = self.client.get('/api/recipes-filter/?search=cook')
+        self.assertEqual(response.data['count'], 1)
+
+
+class RecipeCountersTest(RecipeFixturesMixin, TestCase):
+    """Денормализованные счётчики рецептов."""
+
+    def setUp(self):
+        super().setUp()
+        call_command('reconcile_counters', stdout=io.StringIO())
+
+    def test_favorite_endpoint_updates_counter(self):
+        recipe = self.recipes[1]
+        url = f'/api/recipes/{recipe.id}/favorite/'
+        self.client.post(url)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorite_count, 1)
+        self.client.delete(url)
+        self.client.delete(url)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorite_count, 0)
+
+    def test_user_delete_updates_counter(self):
+        self.user.delete()
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].favorite_count, 0)
+
+    def test_filter_by_ingredient_count(self):
+        recipe = self.recipes[0]
+        IngredientRecipe.objects.filter(
+            recipe=recipe, ingredient=self.ingredients[0]).delete()
+        out = io.StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('1', out.getvalue())
+        response = self.client.get(
+            '/api/recipes-filter/?max_ingredients=2'
+        )
+        self.assertEqual(
+            [item['id'] for item in response.data['results']], [recipe.id]
+        )
+
+
+class StatisticsSnapshotTest(RecipeFixturesMixin, TestCase):
+    """Снимок статистики."""
+
+    def test_snapshot_is_served_without_aggregates(self):
+        first = self.client.get('/api/statistics/')
+        self.assertEqual(first.status_code, 200)
+        # Подписки, избранное и список покупок пользователя.
+        with self.assertNumQueries(3):
+            second = self.client.get('/api/statistics/')
+        self.assertEqual(first.data, second.data)
+        self.assertIn('generated_at', second.data)
+        self.assertEqual(second.data['overall_statistics']['total_recipes'],
+                         100)
+
+    def test_user_flags_and_absolute_urls(self):
+        call_command('reconcile_counters', stdout=io.StringIO())
+        response = self.client.get('/api/statistics/')
+        recipe = next(
+            recipe for recipe in response.data['popular_recipes']
+            if recipe['id'] == self.recipes[0].id
+        )
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertTrue(recipe['image'].startswith('http://testserver/'))
+
+    def test_fresh_is_admin_only(self):
+        generated_at = self.client.get('/api/statistics/').data[
+            'generated_at']
+        response = self.client.get('/api/statistics/?fresh=1')
+        self.assertEqual(response.data['generated_at'], generated_at)
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        )
+        response = self.client.get('/api/statistics/?fresh=1')
+        self.assertNotEqual(response.data['generated_at'], generated_at)
+        self.assertEqual(response.data['overall_statistics']['total_users'],
+                         6)
+
+    def test_changes_refresh_snapshot(self):
+        self.client.get('/api/statistics/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(
+                name='Новый', author=self.authors[0], image='x.png',
+                text='text', cooking_time=5,
+            )
+        response = self.client.get('/api/statistics/')
+        self.assertEqual(
+            response.data['overall_statistics']['total_recipes'], 101)
+
+    def test_change_does_not_rebuild_snapshot_inline(self):
+        self.client.get('/api/statistics/')
+        recipe = self.recipes[30]
+        # Только INSERT: снимок удаляется, а не пересчитывается.
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                favorite = Favorite.objects.create(
+                    user=self.authors[1], recipe=recipe)
+        self.assertIsNone(cache.get(statistics.SNAPSHOT_KEY))
+        self.client.get('/api/statistics/')
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                favorite.delete()
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=False)
+    def test_refresh_is_scheduled_once_per_delay(self):
+        path = 'api.tasks.refresh_statistics_snapshot.apply_async'
+        with mock.patch(path) as apply_async:
+            for recipe in self.recipes[30:33]:
+                with self.captureOnCommitCallbacks(execute=True):
+                    Favorite.objects.create(
+                        user=self.authors[1], recipe=recipe)
+                statistics.refresh_snapshot()
+        apply_async.assert_called_once_with(
+            countdown=settings.STATISTICS_REFRESH_DELAY)
+
+
+class UserProfileCacheTest(RecipeFixturesMixin, TestCase):
+    """Кешированный профиль пользователя."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.authors[0]
+        self.url = f'/api/users/{self.author.id}/profile/'
+
+    def test_cold_and_warm_query_counts(self):
+        # Пользователь с агрегатами, рецепты, теги, ингредиенты и три
+        # запроса данных текущего пользователя.
+        with self.assertNumQueries(7):
+            cold = self.client.get(self.url)
+        with self.assertNumQueries(3):
+            warm = self.client.get(self.url)
+        self.assertEqual(cold.data, warm.data)
+        self.assertEqual(warm.data['statistics']['recipes_count'], 25)
+        self.assertEqual(warm.data['statistics']['followers_count'], 1)
+        self.assertTrue(warm.data['statistics']['is_subscribed'])
+        self.assertTrue(warm.data['user']['is_subscribed'])
+        self.assertEqual(len(warm.data['recent_recipes']), 5)
+
+    def test_viewer_specific_subscription(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(self.authors[1])
+        response = self.client.get(self.url)
+        self.assertFalse(response.data['statistics']['is_subscribed'])
+
+    def test_invalidation_on_events(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(self.authors[1])
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['followers_count'], 2)
+        recipe = self.recipes[10]
+        self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['popular_recipes'][0]['id'], recipe.id)
+        Recipe.objects.create(
+            name='Новый', author=self.author, image='x.png',
+            text='text', cooking_time=5,
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['recipes_count'], 26)
+        self.assertEqual(response.data['recent_recipes'][0]['name'], 'Новый')
+
+    def test_invalidation_on_ingredient_only_edit(self):
+        recipe = self.recipes[24]
+        Recipe.objects.filter(id=recipe.id).update(ingredient_count=3)
+        self.client.get(self.url)
+        self.client.force_authenticate(self.author)
+        payload = {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 7 if index == 0 else 2}
+                for index, ingredient in enumerate(self.ingredients)
+            ],
+        }
+        with mock.patch('api.serializers.schedule_refresh') as refresh:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        refresh.assert_called_once_with()
+        response = self.client.get(self.url)
+        data = next(item for item in response.data['recent_recipes']
+                    + response.data['popular_recipes']
+                    if item['id'] == recipe.id)
+        amounts = {item['id']: item['amount'] for item in data['ingredients']}
+        self.assertEqual(amounts[self.ingredients[0].id], 7)
+
+    def test_unknown_user(self):
+        response = self.client.get('/api/users/0/profile/')
+        self.assertEqual(response.status_code, 404)
+
+
+class IngredientIndexTest(TestCase):
+    """Автодополнение ингредиентов из индекса в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Соль морская', 'соль', 'Сахар', 'Морская капуста',
+                     'Солод', 'Фасоль'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, query):
+        response = self.client.get(f'/api/ingredients/?name={query}')
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def test_ranking(self):
+        self.assertEqual(
+            self.names('СОЛ'), ['Солод', 'соль', 'Соль морская', 'Фасоль'])
+        self.assertEqual(
+            self.names('соль'), ['соль', 'Соль морская', 'Фасоль'])
+        self.assertEqual(
+            self.names('морск'), ['Морская капуста', 'Соль морская'])
+
+    def test_warm_index_skips_database(self):
+        self.names('с')
+        with self.assertNumQueries(0):
+            self.names('са')
+
+    def test_cap(self):
+        index = ingredient_index.get()
+        self.assertEqual(
+            [item['name'] for item in index.search('с', limit=2)],
+            ['Сахар', 'Солод'],
+        )
+
+    def test_refresh_on_change(self):
+        self.assertEqual(self.names('перец'), [])
+        Ingredient.objects.create(name='Перец', measurement_unit='г')
+        self.assertEqual(self.names('перец'), ['Перец'])
+        self.assertEqual(len(self.client.get('/api/ingredients/').data), 7)
+
+
+class TagRegistryTest(RecipeFixturesMixin, TestCase):
+    """Справочник тегов в памяти."""
+
+    def test_tags_and_nested_tags_without_queries(self):
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+        self.assertEqual([tag['slug'] for tag in response.data],
+                         ['tag0', 'tag1'])
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/tags/{self.tags[1].id}/')
+        self.assertEqual(response.data['slug'], 'tag1')
+        self.assertEqual(self.client.get('/api/tags/0/').status_code, 404)
+
+    def test_filter_by_slug_and_refresh(self):
+        tag = Tag.objects.create(name='new', color='#FFFFFF', slug='new')
+        recipe = self.recipes[0]
+        TagRecipe.objects.create(recipe=recipe, tag=tag)
+        response = self.client.get('/api/recipes/?tags=new&limit=10')
+        self.assertEqual(
+            [item['id'] for item in response.data['results']], [recipe.id])
+        self.assertEqual(
+            [item['slug'] for item in response.data['results'][0]['tags']],
+            ['tag0', 'tag1', 'new'],
+        )
+        response = self.client.get('/api/recipes/?tags=missing')
+        self.assertEqual(response.status_code, 400)
+        tag.slug = 'renamed'
+        tag.save()
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.data['tags'][2]['slug'], 'renamed')
+
+
+class ShoppingCartDownloadTest(RecipeFixturesMixin, TestCase):
+    """Выгрузка списка покупок."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        for recipe in self.recipes[:3]:
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+    def download(self, query=''):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url + query)
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        return response, content
+
+    def test_txt_is_default(self):
+        response, content = self.download()
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn('shopping-list.txt', response['Content-Disposition'])
+        self.assertEqual(content, ''.join(
+            f'ingredient{index}, г - 6;\n' for index in range(3)))
+
+    def test_csv(self):
+        response, content = self.download('?format=csv')
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertEqual(
+            content.splitlines()[:2],
+            ['name,measurement_unit,amount', 'ingredient0,г,6'],
+        )
+
+    def test_json(self):
+        response, content = self.download('?format=json')
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(content.encode()))[0],
+            {'name': 'ingredient0', 'measurement_unit': 'г', 'amount': 6},
+        )
+
+    def test_empty_cart(self):
+        for recipe in self.recipes[:3]:
+            self.client.delete(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+        self.assertEqual(self.download('?format=json')[1], '[]')
+
+    def test_recipe_edit_and_delete_update_totals(self):
+        recipe = self.recipes[0]
+        self.client.force_authenticate(self.authors[0])
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {
+                'name': recipe.name,
+                'text': 'text',
+                'cooking_time': 10,
+                'tags': [self.tags[0].id],
+                'ingredients': [
+                    {'id': self.ingredients[0].id, 'amount': 10},
+                    {'id': self.ingredients[1].id, 'amount': 2},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.download()[1], (
+            'ingredient0, г - 14;\n'
+            'ingredient1, г - 6;\n'
+            'ingredient2, г - 4;\n'
+        ))
+        recipe.delete()
+        self.assertEqual(self.download()[1], (
+            'ingredient0, г - 4;\n'
+            'ingredient1, г - 4;\n'
+            'ingredient2, г - 4;\n'
+        ))
+
+    def test_rebuild_command(self):
+        expected = set(ShoppingCartIngredient.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'))
+        ShoppingCartIngredient.objects.update(amount=1)
+        call_command('rebuild_shopping_cart_totals', stdout=io.StringIO())
+        self.assertEqual(set(ShoppingCartIngredient.objects.values_list(
+            'user_id', 'ingredient_id', 'amount')), expected)
+
+
+class RelationToggleTest(RecipeFixturesMixin, TestCase):
+    """Добавление и удаление избранного, покупок и подписок."""
+
+    def test_status_codes_and_messages(self):
+        recipe = self.recipes[1]
+        cases = (
+            (f'/api/recipes/{recipe.id}/favorite/',
+             'Вы уже добавили в избранное!', 'Этот рецепт не в избранном.'),
+            (f'/api/recipes/{recipe.id}/shopping_cart/',
+             'Уже добавлен в список покупок.',
+             'Этого рецепта нет в списке покупок.'),
+            (f'/api/users/{self.authors[1].id}/subscribe/',
+             'Такая подписка уже есть.', 'Такой подписки нет.'),
+        )
+        for url, exists, missing in cases:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 201)
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['non_field_errors'], [exists])
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                response = self.client.delete(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['non_field_errors'], [missing])
+
+    def test_response_bodies(self):
+        recipe = self.recipes[1]
+        response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(
+            set(response.data), {'id', 'name', 'image', 'cooking_time'})
+        self.assertEqual(response.data['id'], recipe.id)
+        response = self.client.post(
+            f'/api/users/{self.authors[1].id}/subscribe/')
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(response.data['recipes_count'], 25)
+
+    def test_errors(self):
+        self.assertEqual(
+            self.client.post('/api/recipes/0/favorite/').status_code, 404)
+        self.assertEqual(
+            self.client.post('/api/users/0/subscribe/').status_code, 404)
+        self.assertEqual(
+            self.client.delete('/api/users/0/subscribe/').status_code, 404)
+        response = self.client.post(f'/api/users/{self.user.id}/subscribe/')
+        self.assertEqual(response.data['non_field_errors'],
+                         ['На себя нельзя подписаться.'])
+
+    def test_single_statement_delete(self):
+        url = f'/api/recipes/{self.recipes[1].id}/shopping_cart/'
+        self.client.post(url)
+        with CaptureQueriesContext(connection) as context:
+            self.client.delete(url)
+        deletes = [query['sql'] for query in context.captured_queries
+                   if 'shoppinglist' in query['sql'].lower()]
+        self.assertEqual(len(deletes), 1)
+        self.assertIn('RETURNING', deletes[0])
+
+    def test_query_counts(self):
+        recipe = self.recipes[1]
+        # Снимок статистики при изменении не пересчитывается, а подписка
+        # сразу заполняет ленту (задачи Celery в тестах выполняются сразу).
+        self.client.get('/api/statistics/')
+        cases = (
+            (f'/api/recipes/{recipe.id}/favorite/', 5, 5),
+            (f'/api/recipes/{recipe.id}/shopping_cart/', 10, 9),
+            (f'/api/users/{self.authors[1].id}/subscribe/', 9, 2),
+        )
+        for url, post_queries, delete_queries in cases:
+            for method, queries in (('post', post_queries),
+                                    ('delete', delete_queries)):
+                with self.subTest(url=url, method=method):
+                    with self.assertNumQueries(queries):
+                        with self.captureOnCommitCallbacks(execute=True):
+                            getattr(self.client, method)(url)
+
+
+class BulkRelationTest(RecipeFixturesMixin, TestCase):
+    """Пакетное добавление и удаление избранного и покупок."""
+
+    favorite_url = '/api/recipes/favorite/bulk/'
+    shopping_url = '/api/recipes/shopping_cart/bulk/'
+
+    def favorite_counts(self, recipes):
+        return list(
+            Recipe.objects.filter(id__in=[recipe.id for recipe in recipes])
+            .order_by('id').values_list('favorite_count', flat=True)
+        )
+
+    def test_favorite_results_and_counters(self):
+        recipes = self.recipes[:3]
+        ids = [recipe.id for recipe in recipes] + [10 ** 6]
+        before = self.favorite_counts(recipes)
+        response = self.client.post(
+            self.favorite_url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], {
+            recipes[0].id: 'exists',
+            recipes[1].id: 'added',
+            recipes[2].id: 'added',
+            10 ** 6: 'not_found',
+        })
+        self.assertEqual(self.favorite_counts(recipes),
+                         [before[0], before[1] + 1, before[2] + 1])
+        response = self.client.delete(
+            self.favorite_url, {'ids': ids[1:]}, format='json')
+        self.assertEqual(response.data['results'], {
+            recipes[1].id: 'removed',
+            recipes[2].id: 'removed',
+            10 ** 6: 'not_found',
+        })
+        self.assertEqual(self.favorite_counts(recipes), before)
+        response = self.client.delete(
+            self.favorite_url, {'ids': ids[1:2]}, format='json')
+        self.assertEqual(response.data['results'], {recipes[1].id: 'missing'})
+
+    def test_shopping_cart_totals(self):
+        ids = [recipe.id for recipe in self.recipes[:4]]
+        self.client.post(self.shopping_url, {'ids': ids}, format='json')
+        self.assertEqual(
+            set(ShoppingCartIngredient.objects.filter(user=self.user)
+                .values_list('amount', flat=True)),
+            {8},
+        )
+        self.client.delete(self.shopping_url, {'ids': ids[:3]}, format='json')
+        self.assertEqual(
+            set(ShoppingCartIngredient.objects.filter(user=self.user)
+                .values_list('amount', flat=True)),
+            {2},
+        )
+
+    def test_constant_queries(self):
+        for count in (1, 20):
+            ids = [recipe.id for recipe in self.recipes[30:30 + count]]
+            with CaptureQueriesContext(connection) as context:
+                self.client.post(self.favorite_url, {'ids': ids},
+                                 format='json')
+            inserts = [query['sql'] for query in context.captured_queries
+                       if query['sql'].startswith('INSERT')]
+            self.assertEqual(len(inserts), 1)
+            self.assertLessEqual(len(context.captured_queries), 8)
+
+    def test_validation(self):
+        cases = (
+            {},
+            {'ids': []},
+            {'ids': ['x']},
+            {'ids': list(range(1, 102))},
+        )
+        for data in cases:
+            with self.subTest(data=data):
+                response = self.client.post(
+                    self.favorite_url, data, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        response = self.client.post(
+            self.favorite_url, {'ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+class FeedTest(RecipeFixturesMixin, TestCase):
+    """Лента рецептов по подпискам."""
+
+    url = '/api/users/feed/'
+
+    def subscribe(self, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/users/{author.id}/subscribe/')
+
+    def read_feed(self, limit=7):
+        seen = []
+        url = f'{self.url}?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return seen
+
+    def expected(self, *authors):
+        return list(
+            Recipe.objects.filter(author__in=authors)
+            .order_by('-pub_date', '-id').values_list('id', flat=True)
+        )
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        self.subscribe(self.authors[1])
+        self.subscribe(self.authors[2])
+        self.assertEqual(self.read_feed(),
+                         self.expected(self.authors[1], self.authors[2]))
+        self.client.delete(f'/api/users/{self.authors[1].id}/subscribe/')
+        self.assertEqual(self.read_feed(), self.expected(self.authors[2]))
+
+    def test_new_recipe_is_fanned_out(self):
+        self.subscribe(self.authors[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name='new', author=self.authors[1],
+                image='backend-media/recipes/images/test.png',
+                text='text', cooking_time=5,
+            )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['id'], recipe.id)
+        self.assertEqual(
+            FeedEntry.objects.filter(recipe=recipe).count(), 1)
+
+    @override_settings(FEED_PULL_FOLLOWERS=2)
+    def test_popular_authors_are_pulled(self):
+        other = self.create_user('other')
+        Follow.objects.create(user=other, following=self.authors[1])
+        self.subscribe(self.authors[1])
+        self.subscribe(self.authors[2])
+        self.assertFalse(
+            FeedEntry.objects.filter(author=self.authors[1]).exists())
+        self.assertEqual(self.read_feed(),
+                         self.expected(self.authors[1], self.authors[2]))
+
+    def test_query_count_does_not_depend_on_limit(self):
+        self.subscribe(self.authors[1])
+        counts = set()
+        for limit in (1, 20):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(f'{self.url}?limit={limit}')
+            counts.add(len(context.captured_queries))
+        self.assertEqual(len(counts), 1, counts)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class ImportDataTest(TestCase):
+    """Импорт ингредиентов командой ``import_data``."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding='utf-8')
+        return str(path)
+
+    def run_import(self, *args):
+        out = io.StringIO()
+        call_command('import_data', *args, stdout=out)
+        return out.getvalue()
+
+    def ingredients(self):
+        return list(Ingredient.objects.order_by('name').values_list(
+            'name', 'measurement_unit'))
+
+    def test_csv_is_idempotent(self):
+        path = self.write('ingredients.csv', 'соль,г\nмука,кг\nсоль,г\n')
+        self.assertIn('новых: 2', self.run_import(path))
+        with self.assertNumQueries(3):
+            output = self.run_import(path, '--batch-size', '10')
+        self.assertIn('новых: 0', output)
+        self.assertIn('строк/с', output)
+        self.assertEqual(self.ingredients(), [('мука', 'кг'), ('соль', 'г')])
+
+    def test_json_fixture_and_plain_list(self):
+        fixture = json.dumps([
+            {'model': 'recipes.ingredient', 'pk': index,
+             'fields': {'name': f'ингредиент {index}',
+                        'measurement_unit': 'г'}}
+            for index in range(50)
+        ])
+        with mock.patch(
+                'recipes.management.commands.import_data.READ_SIZE', 64):
+            self.run_import(self.write('fixture.json', fixture),
+                            '--batch-size', '7')
+        self.assertEqual(Ingredient.objects.count(), 50)
+        plain = json.dumps([{'name': 'соль', 'measurement_unit': 'г'}])
+        self.run_import(self.write('plain.data', plain), '--format', 'json')
+        self.assertEqual(Ingredient.objects.count(), 51)
+
+    def test_update_and_dry_run(self):
+        Ingredient.objects.create(name='соль', measurement_unit='кг')
+        path = self.write('ingredients.csv', 'соль,г\nмука,г\n')
+        output = self.run_import(path, '--update', '--dry-run')
+        self.assertIn('новых: 1, обновлено: 1', output)
+        self.assertEqual(self.ingredients(), [('соль', 'кг')])
+        self.run_import(path)
+        self.assertEqual(self.ingredients(), [('мука', 'г'), ('соль', 'кг')])
+        self.run_import(path, '--update')
+        self.assertEqual(self.ingredients(), [('мука', 'г'), ('соль', 'г')])
+
+    def test_import_refreshes_ingredient_index(self):
+        self.assertEqual(ingredient_index.get().items, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import(self.write('ingredients.csv', 'соль,г\n'))
+        self.assertEqual(
+            [item['name'] for item in ingredient_index.get().items], ['соль'])
+
+
+class RecipeTransferTest(RecipeFixturesMixin, TestCase):
+    """Выгрузка и загрузка рецептов в JSONL."""
+
+    url = '/api/recipes/bulk/'
+
+    def snapshot(self):
+        return [
+            (recipe.name, recipe.author_id, recipe.image.name,
+             recipe.pub_date, recipe.ingredient_count,
+             sorted(recipe.tags.values_list('slug', flat=True)),
+             sorted(recipe.ingredientrecipe_set.values_list(
+                 'ingredient__name', 'amount')))
+            for recipe in Recipe.objects.order_by('name')
+        ]
+
+    def export(self, *args):
+        out = io.StringIO()
+        call_command('export_recipes', *args, stdout=out,
+                     stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_round_trip(self):
+        call_command('reconcile_counters', stdout=io.StringIO())
+        before = self.snapshot()
+        exported = self.export('--batch-size', '7')
+        self.assertEqual(len(exported.splitlines()), 100)
+        Recipe.objects.all().delete()
+        path = Path(tempfile.mkdtemp()) / 'recipes.jsonl'
+        self.addCleanup(path.unlink)
+        path.write_text(exported, encoding='utf-8')
+        out = io.StringIO()
+        call_command('import_recipes', str(path), '--batch-size', '30',
+                     stdout=out, stderr=io.StringIO())
+        self.assertIn('добавлено: 100', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+        call_command('import_recipes', str(path), stdout=out,
+                     stderr=io.StringIO())
+        self.assertIn('пропущено: 100', out.getvalue())
+        self.assertEqual(Recipe.objects.count(), 100)
+
+    def test_import_query_count_does_not_depend_on_size(self):
+        lines = self.export().splitlines()
+        counts = {}
+        for count in (10, 60):
+            Recipe.objects.all().delete()
+            stdin = io.StringIO('\n'.join(lines[:count]))
+            with mock.patch('sys.stdin', stdin):
+                with CaptureQueriesContext(connection) as context:
+                    call_command('import_recipes', '-', stdout=io.StringIO())
+            counts[count] = len(context.captured_queries)
+        self.assertEqual(counts[10], counts[60])
+
+    def test_endpoint(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        record = json.loads(lines[0])
+        record['name'] = 'imported'
+        body = '\n'.join([json.dumps(record), lines[1], '{"name": 1}'])
+        response = self.client.post(
+            self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['skipped'], 1)
+        self.assertEqual(response.data['errors'], 1)
+        self.assertTrue(response.data['error_messages'][0].startswith(
+            'Строка 3'))
+        self.assertTrue(Recipe.objects.filter(name='imported').exists())
+
+
+class MediaFixturesMixin(RecipeFixturesMixin):
+    """Картинки для тестов во временном MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    @staticmethod
+    def data_uri(size=(800, 600), color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, format='PNG')
+        return 'data:image/png;base64,' + base64.b64encode(
+            buffer.getvalue()).decode()
+
+    def payload(self, image, name='with image'):
+        return {
+            'name': name,
+            'text': 'text',
+            'cooking_time': 5,
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 1}],
+            'image': image,
+        }
+
+
+class ImageRenditionsTest(MediaFixturesMixin, TestCase):
+    """Загрузка картинок и уменьшенные копии."""
+
+    def test_recipe_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', self.payload(self.data_uri()), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertTrue(recipe.image.name.endswith('.png'))
+        self.assertEqual(recipe.image_renditions['source'], recipe.image.name)
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        urls = response.data['image_renditions']
+        self.assertEqual(set(urls), set(RENDITIONS))
+        extension = RENDITION_FORMAT.lower()
+        for size_name, size in RENDITIONS.items():
+            self.assertIn('blobs/', urls[size_name])
+            self.assertTrue(urls[size_name].endswith(f'.{extension}'))
+            path = recipe.image_renditions[size_name]
+            with default_storage.open(path) as file, Image.open(file) as image:
+                self.assertLessEqual(image.width, size[0])
+        self.assertFalse(update_renditions(
+            Recipe, recipe.id, 'image', 'image_renditions'))
+
+    def test_original_until_rendered(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(self.data_uri()), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        urls = response.data['image_renditions']
+        self.assertEqual(set(urls.values()), {response.data['image']})
+
+    def test_invalid_images(self):
+        oversize = self.data_uri((2000, 2000))
+        invalid = {
+            'not base64': 'data:image/png;base64,###',
+            'not an image': 'data:image/png;base64,'
+                            + base64.b64encode(b'plain text').decode(),
+            'too large': oversize,
+        }
+        with override_settings(MAX_IMAGE_UPLOAD_SIZE=len(oversize) // 2):
+            for name, image in invalid.items():
+                with self.subTest(name):
+                    response = self.client.post(
+                        '/api/recipes/', self.payload(image), format='json')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.filter(name='with image').exists())
+
+    def test_avatar_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                '/api/users/avatar/', {'avatar': self.data_uri()},
+                format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.user.refresh_from_db()
+        renditions = self.user.avatar_renditions
+        self.assertEqual(renditions['source'], self.user.avatar.name)
+        response = self.client.put(
+            '/api/users/avatar/', {'avatar': 'data:image/png;base64,###'},
+            format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('avatar', response.data)
+        self.client.delete('/api/users/avatar_delete/')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_renditions, {})
+        self.assertEqual(MediaBlob.objects.get(
+            name=renditions['thumbnail']).refs, 0)
+
+
+class MediaStorageTest(MediaFixturesMixin, TestCase):
+    """Хранилище с именами по содержимому."""
+
+    def save_recipe(self, image, recipe_id=None, name='with image'):
+        payload = self.payload(image, name)
+        with self.captureOnCommitCallbacks(execute=True):
+            if recipe_id is None:
+                response = self.client.post(
+                    '/api/recipes/', payload, format='json')
+            else:
+                response = self.client.patch(
+                    f'/api/recipes/{recipe_id}/', payload, format='json')
+        self.assertIn(response.status_code, (200, 201), response.data)
+        return Recipe.objects.get(id=response.data['id'])
+
+    def refs(self, name):
+        return MediaBlob.objects.get(name=name).refs
+
+    def test_same_image_is_stored_once(self):
+        image = self.data_uri()
+        recipe = self.save_recipe(image)
+        name = recipe.image.name
+        self.assertTrue(name.startswith('blobs/'))
+        self.assertEqual(self.refs(name), 1)
+        other = self.save_recipe(image, name='same image')
+        self.assertEqual(other.image.name, name)
+        self.assertEqual(self.refs(name), 2)
+        with mock.patch.object(FileSystemStorage, '_save') as save_file:
+            recipe = self.save_recipe(image, recipe.id)
+        save_file.assert_not_called()
+        self.assertEqual(recipe.image.name, name)
+        self.assertEqual(self.refs(name), 2)
+
+    def test_orphans_are_collected(self):
+        recipe = self.save_recipe(self.data_uri())
+        old = recipe.image.name
+        old_renditions = dict(recipe.image_renditions)
+        recipe = self.save_recipe(self.data_uri(color='blue'), recipe.id)
+        self.assertNotEqual(recipe.image.name, old)
+        self.assertEqual(self.refs(old), 0)
+        self.assertEqual(self.refs(old_renditions['thumbnail']), 0)
+        self.assertEqual(collect_garbage(grace=3600), 0)
+        self.assertEqual(collect_garbage(grace=0), 4)
+        self.assertFalse(default_storage.exists(old))
+        self.assertFalse(MediaBlob.objects.filter(name=old).exists())
+        self.assertTrue(default_storage.exists(recipe.image.name))
+        renditions = dict(recipe.image_renditions)
+        recipe.delete()
+        self.assertEqual(collect_garbage(grace=0), 4)
+        self.assertFalse(default_storage.exists(renditions['full']))
+
+    def test_imported_references_are_tracked(self):
+        recipe = self.save_recipe(self.data_uri())
+        name = recipe.image.name
+        exported = io.StringIO()
+        call_command('export_recipes', stdout=exported, stderr=io.StringIO())
+        Recipe.objects.all().delete()
+        MediaBlob.objects.all().delete()
+        with mock.patch('sys.stdin', io.StringIO(exported.getvalue())):
+            call_command('import_recipes', '-', stdout=io.StringIO())
+        blob = MediaBlob.objects.get(name=name)
+        self.assertEqual(blob.refs, Recipe.objects.filter(image=name).count())
+        self.assertEqual(blob.size, default_storage.size(name))
+        collect_untracked(grace=0)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_untracked_files_are_collected(self):
+        recipe = self.save_recipe(self.data_uri())
+        name = recipe.image.name
+        MediaBlob.objects.filter(name=name).delete()
+        self.assertEqual(collect_untracked(grace=0), 1)
+        self.assertFalse(default_storage.exists(name))
+        self.assertTrue(
+            default_storage.exists(recipe.image_renditions['card']))
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """Аутентификация по токену с кешем."""
+
+    url = '/api/users/me/'
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='old-password', first_name='r', last_name='r')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries
+                if 'authtoken_token' in query['sql']]
+
+    def test_token_is_read_once(self):
+        self.assertEqual(len(self.token_queries()), 1)
+        self.assertEqual(self.token_queries(), [])
+        local_tokens.clear()
+        self.assertEqual(self.token_queries(), [])
+        names, values = cache.get(token_cache_key(self.token.key))
+        self.assertEqual(dict(zip(names, values))['id'], self.user.id)
+        self.assertFalse(
+            any(self.token.key in key for key in cache._cache))
+
+    def test_logout(self):
+        self.token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deactivation(self):
+        self.token_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_password_change(self):
+        self.token_queries()
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'old-password',
+            'new_password': 'new-Pa55word',
+        }, format='json')
+        self.assertEqual(response.status_code, 204, response.data)
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+        self.assertEqual(len(self.token_queries()), 1)
+
+    def test_each_request_gets_own_user(self):
+        self.token_queries()
+        request = APIRequestFactory().get(
+            self.url, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        first, _ = CachedTokenAuthentication().authenticate(request)
+        second, _ = CachedTokenAuthentication().authenticate(request)
+        self.assertEqual(first.pk, second.pk)
+        self.assertIsNot(first._state, second._state)
+        first.avatar_renditions['thumbnail'] = 'changed'
+        self.assertEqual(second.avatar_renditions, {})
+
+    def test_writes_do_not_restore_stale_fields(self):
+        self.token_queries()
+        # Обновление без сигналов: в кеше остаётся старый пользователь.
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        response = self.client.put('/api/users/avatar/', {
+            'avatar': ImageRenditionsTest.data_uri((10, 10)),
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_staff)
+        self.assertTrue(self.user.avatar)
+
+    def test_last_login_keeps_cache(self):
+        self.token_queries()
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.token_queries(), [])
+
+
+class RelationToggleConcurrencyTest(TransactionTestCase):
+    """Одновременные запросы на добавление и удаление."""
+
+    threads = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite в памяти не ждёт блокировок: '
+                          'TEST_DB_NAME должен указывать на файл.')
+        cache.clear()
+        self.user = RecipeFixturesMixin.create_user('reader')
+        self.author = RecipeFixturesMixin.create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='ingredient', measurement_unit='г')
+        self.recipe = RecipeFixturesMixin.create_recipes(
+            self.author, 1, [], [ingredient])[0]
+
+    def hammer(self, method, url):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def worker():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker)
+                   for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return sorted(statuses)
+
+    def test_concurrent_toggles(self):
+        for url in (f'/api/recipes/{self.recipe.id}/favorite/',
+                    f'/api/recipes/{self.recipe.id}/shopping_cart/',
+                    f'/api/users/{self.author.id}/subscribe/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.hammer('post', url),
+                                 [201] + [400] * (self.threads - 1))
+                self.assertEqual(self.hammer('delete', url),
+                                 [204] + [400] * (self.threads - 1))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorite_count, 0)
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+
+
+class DeployChecksTest(TestCase):
+    """Проверки общего кеша и брокера перед развёртыванием."""
+
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual(
+            [message.id for message in check_shared_cache(None)],
+            ['api.W001'],
+        )
+        redis = {'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://redis:6379/0',
+        }}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_eager_tasks_are_reported(self):
+        with override_settings(CELERY_TASK_ALWAYS_EAGER=True):
+            self.assertEqual(
+                [message.id for message in check_task_broker(None)],
+                ['api.W002'],
+            )
+        with override_settings(CELERY_TASK_ALWAYS_EAGER=False):
+            self.assertEqual(check_task_broker(None), [])
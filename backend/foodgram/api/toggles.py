@@ -0,0 +1,132 @@
+"""Идемпотентные добавление и удаление связей одним запросом.
+
+Избранное, список покупок и подписки добавляются через
+``INSERT ... ON CONFLICT DO NOTHING RETURNING`` и удаляются через
+``DELETE ... RETURNING``: проверка и запись происходят в одном
+запросе, поэтому одновременные запросы не падают на уникальном
+ограничении, а побочные эффекты выполняет только тот, кто изменил
+строку. Сигналы ``post_save`` и ``post_delete`` отправляются вручную,
+как при обычном сохранении.
+"""
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+
+def relation_error(message):
+    """Ошибка в том же виде, что и из ``validate`` сериализатора."""
+    return serializers.ValidationError(
+        {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+    )
+
+
+def _statement_parts(instance, fields):
+    """Таблица, столбцы, значения и первичный ключ для SQL."""
+    opts = instance._meta
+    quote = connection.ops.quote_name
+    fields = [opts.get_field(name) for name in fields]
+    return (
+        quote(opts.db_table),
+        [quote(field.column) for field in fields],
+        [
+            field.get_db_prep_save(getattr(instance, field.attname),
+                                   connection)
+            for field in fields
+        ],
+        quote(opts.pk.column),
+    )
+
+
+def insert_ignore(model, **values):
+    """Добавить строку, если такой ещё нет.
+
+    ``values`` - поля модели: объекты или id (``user=``, ``recipe_id=``).
+    Возвращает созданный объект или ``None``, если строка уже была.
+    """
+    instance = model(**values)
+    table, columns, params, pk = _statement_parts(instance, values)
+    placeholders = ', '.join(['%s'] * len(params))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}) '
+            f'VALUES ({placeholders}) ON CONFLICT DO NOTHING '
+            f'RETURNING {pk}',
+            params,
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    instance.pk = row[0]
+    instance._state.adding = False
+    post_save.send(sender=model, instance=instance, created=True,
+                   update_fields=None, raw=False, using=connection.alias)
+    return instance
+
+
+def delete_returning(model, **values):
+    """Удалить строку и вернуть удалённый объект или ``None``."""
+    instance = model(**values)
+    table, columns, params, pk = _statement_parts(instance, values)
+    condition = ' AND '.join(f'{column} = %s' for column in columns)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {condition} RETURNING {pk}',
+            params,
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    instance.pk = row[0]
+    post_delete.send(sender=model, instance=instance, origin=instance,
+                     using=connection.alias)
+    return instance
+
+
+def add_recipes(model, user, recipe_ids):
+    """Добавить пользователю связи с рецептами одним INSERT.
+
+    Для избранного и списка покупок. Возвращает множество id рецептов,
+    которые действительно добавлены. Сигналы не отправляются: побочные
+    эффекты выполняет вызывающий код для всей пачки сразу.
+    """
+    if not recipe_ids:
+        return set()
+    opts = model._meta
+    quote = connection.ops.quote_name
+    user_column = quote(opts.get_field('user').column)
+    recipe_column = quote(opts.get_field('recipe').column)
+    values = ', '.join(['(%s, %s)'] * len(recipe_ids))
+    params = [value for recipe_id in recipe_ids
+              for value in (user.id, recipe_id)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(opts.db_table)} '
+            f'({user_column}, {recipe_column}) VALUES {values} '
+            f'ON CONFLICT DO NOTHING RETURNING {recipe_column}',
+            params,
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def remove_recipes(model, user, recipe_ids):
+    """Удалить связи пользователя с рецептами одним DELETE.
+
+    Возвращает множество id рецептов, связи с которыми удалены.
+    """
+    if not recipe_ids:
+        return set()
+    opts = model._meta
+    quote = connection.ops.quote_name
+    user_column = quote(opts.get_field('user').column)
+    recipe_column = quote(opts.get_field('recipe').column)
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(opts.db_table)} '
+            f'WHERE {user_column} = %s '
+            f'AND {recipe_column} IN ({placeholders}) '
+            f'RETURNING {recipe_column}',
+            [user.id, *recipe_ids],
+        )
+        return {row[0] for row in cursor.fetchall()}
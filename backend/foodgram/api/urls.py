@@ -2,8 +2,10 @@ from django.urls import include, path
 from rest_framework import routers
 
 from api.views import (
-    CustomUserViewSet, IngredientViewSet, ListSubscribeViewSet, RecipeViewSet, TagViewSet,
-    download_shopping_cart, favorite, shopping, subscribe,
+    CustomUserViewSet, FeedViewSet, IngredientViewSet, ListSubscribeViewSet,
+    RecipeViewSet, TagViewSet,
+    download_shopping_cart, favorite, favorite_bulk, recipes_bulk, shopping,
+    shopping_bulk, subscribe,
     get_recipe_short_link, advanced_recipe_filter, user_profile_detail, recipe_statistics
 )
 
@@ -13,12 +15,16 @@ router_v1.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router_v1.register(r'tags', TagViewSet, basename='tags')
 router_v1.register(r'users/subscriptions', ListSubscribeViewSet,
                    basename='get_subscribe')
+router_v1.register(r'users/feed', FeedViewSet, basename='feed')
 router_v1.register(r'users', CustomUserViewSet)
 router_v1.register(r'recipes', RecipeViewSet, basename='recipes')
 
 function_urls = [
     path('recipes/download_shopping_cart/', download_shopping_cart,
          name='download_shopping_cart'),
+    path('recipes/bulk/', recipes_bulk, name='recipes_bulk'),
+    path('recipes/favorite/bulk/', favorite_bulk, name='favorite_bulk'),
+    path('recipes/shopping_cart/bulk/', shopping_bulk, name='shopping_bulk'),
     path('recipes/<int:recipe_id>/favorite/', favorite, name='favorite'),
     path('users/<int:user_id>/subscribe/', subscribe, name='subscribe'),
     path('recipes/<int:recipe_id>/shopping_cart/', shopping, name='shopping'),
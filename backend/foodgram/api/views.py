@@ -1,49 +1,96 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, OuterRef, Value
-from django.http import HttpResponse
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count, Avg
+from django.db import transaction
+from django.db.models import F
 from djoser.conf import settings
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
-from rest_framework.filters import SearchFilter
-from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import (action, api_view, permission_classes,
+                                       renderer_classes)
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.cache import (INGREDIENTS_VERSION_KEY, RECIPES_VERSION_KEY,
+                       TAGS_VERSION_KEY, bump_profile_version,
+                       bump_user_state_version)
+from api.filters import RecipeFilter
+from api.images import Base64ImageField, delete_renditions
+from api.ingredient_index import ingredient_index
+from api.pagination import (FeedKeysetPagination, FollowKeysetPagination,
+                            RecipeKeysetPagination)
 from api.permissions import IsAuthor
+from api.profiles import get_profile
+from api.querysets import get_follow_queryset, get_recipe_queryset
+from api.renderers import CSVRenderer, FastJSONRenderer, PlainTextRenderer
+from api.search import search_recipes
 from api.serializers import (CustomUserSerializer, FavoriteSerializer,
-                             FollowSerializer, IngredientRecipe,
-                             IngredientSerializer, RecipeSerializer,
+                             FollowSerializer, IngredientSerializer,
+                             RecipeIdsSerializer, RecipeSerializer,
                              RecipeWriteSerializer, ShoppingCardSerializer,
-                             TagSerializer)
-from api.viewsets import ListRetriveViewSet, ListViewSet
+                             TagSerializer,
+                             get_subscribed_ids)
+from api.shopping_cart import iter_shopping_cart
+from api.snapshots import personalize, personalize_user
+from api.statistics import get_snapshot, schedule_refresh
+from api.tag_registry import tag_registry
+from api.toggles import (add_recipes, delete_returning, insert_ignore,
+                         relation_error, remove_recipes)
+from api.viewsets import (ConditionalGetMixin, KeysetPaginationMixin,
+                          ListRetriveViewSet, ListViewSet)
+from recipes import cart_totals
 from recipes.models import (Favorite, Follow, Ingredient, Recipe, ShoppingList,
-                            Tag)
+                            Tag, TagRecipe)
+from recipes.transfer import Importer, iter_export
 
 User = get_user_model()
 
 
-class IngredientViewSet(ListRetriveViewSet):
+class IngredientViewSet(ConditionalGetMixin, ListRetriveViewSet):
     """Ингредиенты."""
 
+    version_keys = (INGREDIENTS_VERSION_KEY,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (DjangoFilterBackend, SearchFilter)
-    filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.list_from_index, request)
 
-class TagViewSet(ListRetriveViewSet):
+    def list_from_index(self, request):
+        """Список и автодополнение по ``?name=`` из индекса в памяти."""
+        index = ingredient_index.get()
+        name = request.query_params.get('name')
+        return Response(index.search(name) if name else index.items)
+
+
+class TagViewSet(ConditionalGetMixin, ListRetriveViewSet):
     """Теги."""
 
+    version_keys = (TAGS_VERSION_KEY,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.list_from_registry, request)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(self.retrieve_from_registry, request, **kwargs)
+
+    def list_from_registry(self, request):
+        return Response(tag_registry.get().items)
+
+    def retrieve_from_registry(self, request, pk):
+        """Тег из справочника в памяти."""
+        try:
+            return Response(tag_registry.get().by_id[int(pk)])
+        except (KeyError, ValueError):
+            raise Http404
+
 
 class CustomUserViewSet(UserViewSet):
     """Пользователи."""
@@ -80,25 +127,16 @@ class CustomUserViewSet(UserViewSet):
         """Загрузить аватар."""
         user = request.user
         if 'avatar' in request.data:
-            # Handle base64 image data
-            avatar_data = request.data['avatar']
-            if isinstance(avatar_data, str) and avatar_data.startswith('data:image'):
-                # Extract the base64 data
-                format, imgstr = avatar_data.split(';base64,')
-                ext = format.split('/')[-1]
-                
-                # Create a ContentFile from the base64 data
-                from django.core.files.base import ContentFile
-                import base64
-                data = ContentFile(base64.b64decode(imgstr), name=f'avatar.{ext}')
-                user.avatar = data
-            else:
-                user.avatar = avatar_data
-            user.save()
+            try:
+                user.avatar = Base64ImageField().run_validation(
+                    request.data['avatar'])
+            except ValidationError as error:
+                raise ValidationError({'avatar': error.detail})
+            user.save(update_fields=['avatar'])
             serializer = self.get_serializer(user)
             return Response(serializer.data)
         return Response(
-            {'error': 'Avatar field is required'}, 
+            {'error': 'Avatar field is required'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
@@ -106,37 +144,28 @@ class CustomUserViewSet(UserViewSet):
     def avatar_delete(self, request, *args, **kwargs):
         """Удалить аватар."""
         user = request.user
-        if user.avatar:
-            user.avatar.delete()
+        delete_renditions(user.avatar_renditions)
         user.avatar = None
-        user.save()
+        user.avatar_renditions = {}
+        user.save(update_fields=['avatar', 'avatar_renditions'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, KeysetPaginationMixin,
+                    viewsets.ModelViewSet):
     """Рецепты."""
 
+    version_keys = (RECIPES_VERSION_KEY,)
+    user_state_dependent = True
+    keyset_pagination_class = RecipeKeysetPagination
+    fast_serialization = True
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
     ordering = ('-pub_date',)
 
     def get_queryset(self):
         """Получить кверисет."""
-        user = self.request.user
-        if user.is_authenticated:
-            return Recipe.objects.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
-                ),
-                is_in_shopping_cart=Exists(
-                    ShoppingList.objects.filter(user=user,
-                                                recipe=OuterRef('pk'))
-                )
-            ).all()
-        return Recipe.objects.annotate(
-            is_favorited=Value(False),
-            is_in_shopping_cart=Value(False)
-        ).all()
+        return get_recipe_queryset(self.request.user, prefetch=False)
 
     def get_serializer_class(self):
         """Получить сериализатор."""
@@ -158,24 +187,46 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Получить контекст."""
         context = super().get_serializer_context()
         context["request"] = self.request
+        context["fast_serialization"] = self.fast_serialization
         return context
 
 
-class ListSubscribeViewSet(ListViewSet):
+class ListSubscribeViewSet(KeysetPaginationMixin, ListViewSet):
     """Список подписок пользователя."""
+    keyset_pagination_class = FollowKeysetPagination
+    fast_serialization = True
     serializer_class = FollowSerializer
     permission_classes = (IsAuthenticated,)
     ordering = ('id',)
 
     def get_queryset(self):
         """Получить кверисет."""
-        user = self.request.user
-        return user.follower.all()
+        return get_follow_queryset(self.request.user)
 
     def get_serializer_context(self):
         """Получить контекст."""
         context = super().get_serializer_context()
         context["request"] = self.request
+        context["fast_serialization"] = self.fast_serialization
+        return context
+
+
+class FeedViewSet(ListViewSet):
+    """Лента рецептов авторов, на которых подписан пользователь."""
+    pagination_class = FeedKeysetPagination
+    fast_serialization = True
+    serializer_class = RecipeSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        """Получить кверисет."""
+        return get_recipe_queryset(self.request.user, prefetch=False)
+
+    def get_serializer_context(self):
+        """Получить контекст."""
+        context = super().get_serializer_context()
+        context["request"] = self.request
+        context["fast_serialization"] = self.fast_serialization
         return context
 
 
@@ -184,23 +235,25 @@ class ListSubscribeViewSet(ListViewSet):
 def favorite(request, recipe_id):
     """Добавить/удалить из избранного"""
     if request.method == "POST":
-        serializer = FavoriteSerializer(
-            data=request.data,
-            context={'request': request, 'recipe_id': recipe_id}
-        )
-        serializer.is_valid(raise_exception=True)
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        serializer.save(user=request.user, recipe=recipe)
+        with transaction.atomic():
+            instance = insert_ignore(
+                Favorite, user=request.user, recipe=recipe)
+            if instance is None:
+                raise relation_error('Вы уже добавили в избранное!')
+            Recipe.objects.filter(id=recipe_id).update(
+                favorite_count=F('favorite_count') + 1)
+        bump_user_state_version(request.user.id)
+        serializer = FavoriteSerializer(
+            instance, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-    serializer = FavoriteSerializer(
-        data=request.data,
-        context={'request': request, 'recipe_id': recipe_id}
-    )
-    serializer.is_valid(raise_exception=True)
-    Favorite.objects.filter(
-        user=request.user,
-        recipe=get_object_or_404(Recipe, id=recipe_id)
-    ).delete()
+    with transaction.atomic():
+        if delete_returning(
+                Favorite, user=request.user, recipe_id=recipe_id) is None:
+            raise relation_error('Этот рецепт не в избранном.')
+        Recipe.objects.filter(id=recipe_id).update(
+            favorite_count=F('favorite_count') - 1)
+    bump_user_state_version(request.user.id)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -208,27 +261,22 @@ def favorite(request, recipe_id):
 @permission_classes([IsAuthenticated])
 def subscribe(request, user_id):
     """Добавить/удалить подписку."""
-    try:
-        following = get_object_or_404(User, id=user_id)
-    except Exception:
-        return Response(status=status.HTTP_404_NOT_FOUND)
     if request.method == "POST":
-        serializer = FollowSerializer(
-            data=request.data,
-            context={'request': request, 'user_id': user_id}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user, following=following)
+        following = get_object_or_404(User, id=user_id)
+        if request.user.id == following.id:
+            raise relation_error('На себя нельзя подписаться.')
+        instance = insert_ignore(
+            Follow, user=request.user, following=following)
+        if instance is None:
+            raise relation_error('Такая подписка уже есть.')
+        bump_user_state_version(request.user.id)
+        serializer = FollowSerializer(instance, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-    serializer = FollowSerializer(
-        data=request.data,
-        context={'request': request, 'user_id': user_id}
-    )
-    serializer.is_valid(raise_exception=True)
-    Follow.objects.filter(
-        user=request.user,
-        following=following
-    ).delete()
+    if delete_returning(
+            Follow, user=request.user, following_id=user_id) is None:
+        get_object_or_404(User, id=user_id)
+        raise relation_error('Такой подписки нет.')
+    bump_user_state_version(request.user.id)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -237,50 +285,132 @@ def subscribe(request, user_id):
 def shopping(request, recipe_id):
     """Добавить/удалить покупку."""
     if request.method == "POST":
+        recipe = get_object_or_404(Recipe, id=recipe_id)
+        with transaction.atomic():
+            instance = insert_ignore(
+                ShoppingList, user=request.user, recipe=recipe)
+            if instance is None:
+                raise relation_error('Уже добавлен в список покупок.')
+            cart_totals.add_recipe(request.user.id, recipe_id)
+        bump_user_state_version(request.user.id)
         serializer = ShoppingCardSerializer(
-            data=request.data,
-            context={'request': request, 'recipe_id': recipe_id}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user,
-                        recipe=get_object_or_404(Recipe, id=recipe_id))
+            instance, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-    serializer = ShoppingCardSerializer(
-        data=request.data,
-        context={'request': request, 'recipe_id': recipe_id}
-    )
-    serializer.is_valid(raise_exception=True)
-    ShoppingList.objects.filter(
-        user=request.user,
-        recipe=get_object_or_404(Recipe, id=recipe_id)
-    ).delete()
+    with transaction.atomic():
+        if delete_returning(
+                ShoppingList, user=request.user, recipe_id=recipe_id) is None:
+            raise relation_error('Этого рецепта нет в списке покупок.')
+        cart_totals.remove_recipe(request.user.id, recipe_id)
+    bump_user_state_version(request.user.id)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def bulk_recipe_relation(request, model, on_change):
+    """Пакетно добавить или удалить связи пользователя с рецептами.
+
+    Существование рецептов проверяется одним запросом, связи
+    добавляются одним INSERT и удаляются одним DELETE. ``on_change``
+    получает id изменённых рецептов, id их авторов и знак изменения.
+    Ответ - статус для каждого id: ``added``, ``exists``, ``removed``,
+    ``missing`` или ``not_found``.
+    """
+    serializer = RecipeIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    authors = dict(
+        Recipe.objects.filter(id__in=ids).values_list('id', 'author_id'))
+    found = [recipe_id for recipe_id in ids if recipe_id in authors]
+    if request.method == "POST":
+        write, delta, done, untouched = add_recipes, 1, 'added', 'exists'
+    else:
+        write, delta, done, untouched = (
+            remove_recipes, -1, 'removed', 'missing')
+    with transaction.atomic():
+        changed = write(model, request.user, found)
+        if changed:
+            on_change(changed,
+                      {authors[recipe_id] for recipe_id in changed}, delta)
+    if changed:
+        bump_user_state_version(request.user.id)
+        schedule_refresh()
+    results = {
+        recipe_id: (
+            'not_found' if recipe_id not in authors
+            else done if recipe_id in changed
+            else untouched
+        )
+        for recipe_id in ids
+    }
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+@api_view(["POST", "DELETE"])
+@permission_classes([IsAuthenticated])
+def favorite_bulk(request):
+    """Добавить/удалить из избранного несколько рецептов."""
+    def favorites_changed(recipe_ids, author_ids, delta):
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            favorite_count=F('favorite_count') + delta)
+        bump_profile_version(*author_ids)
+
+    return bulk_recipe_relation(request, Favorite, favorites_changed)
+
+
+@api_view(["POST", "DELETE"])
+@permission_classes([IsAuthenticated])
+def shopping_bulk(request):
+    """Добавить/удалить из списка покупок несколько рецептов."""
+    def cart_changed(recipe_ids, author_ids, delta):
+        if delta > 0:
+            cart_totals.add_recipes(request.user.id, recipe_ids)
+        else:
+            cart_totals.remove_recipes(request.user.id, recipe_ids)
+
+    return bulk_recipe_relation(request, ShoppingList, cart_changed)
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@renderer_classes([PlainTextRenderer, CSVRenderer, FastJSONRenderer])
 def download_shopping_cart(request):
-    """Скачать список покупок."""
-    ingredients = IngredientRecipe.objects.filter(
-        recipe__shopping_recipe__user=request.user
+    """Скачать список покупок.
+
+    Формат выбирается параметром ``format=txt|csv|json`` или
+    заголовком Accept, по умолчанию - текст.
+    """
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(
+        iter_shopping_cart(request.user, renderer.format),
+        content_type=f'{renderer.media_type}; charset=utf-8',
+        status=status.HTTP_200_OK,
     )
-    shopping_data = {}
-    for ingredient in ingredients:
-        if str(ingredient.ingredient) in shopping_data:
-            shopping_data[f'{str(ingredient.ingredient)}'] += ingredient.amount
-        else:
-            shopping_data[f'{str(ingredient.ingredient)}'] = ingredient.amount
-    filename = "shopping-list.txt"
-    content = ''
-    for ingredient, amount in shopping_data.items():
-        content += f"{ingredient} - {amount};\n"
-    response = HttpResponse(content, content_type='text/plain',
-                            status=status.HTTP_200_OK)
     response['Content-Disposition'] = 'attachment; filename={0}'.format(
-        filename)
+        f'shopping-list.{renderer.format}')
     return response
 
 
+@api_view(["GET", "POST"])
+@permission_classes([IsAdminUser])
+def recipes_bulk(request):
+    """Выгрузить или загрузить рецепты в JSONL.
+
+    GET отдаёт все рецепты потоком, POST читает тело запроса построчно.
+    """
+    if request.method == "GET":
+        response = StreamingHttpResponse(
+            iter_export(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = (
+            'attachment; filename=recipes.jsonl')
+        return response
+    importer = Importer()
+    counts = importer.run(
+        line.decode('utf-8') for line in request.stream or ())
+    return Response(
+        {**counts, 'error_messages': importer.errors},
+        status=status.HTTP_200_OK,
+    )
+
+
 @api_view(["GET"])
 def get_recipe_short_link(request, recipe_id):
     """Получить короткую ссылку на рецепт."""
@@ -303,25 +433,29 @@ def advanced_recipe_filter(request):
     sort_by = request.query_params.get('sort_by', 'pub_date')
     order = request.query_params.get('order', 'desc')
 
-    queryset = Recipe.objects.select_related('author').prefetch_related('tags', 'ingredients')
+    queryset = get_recipe_queryset(request.user)
 
     if search:
-        queryset = queryset.filter(Q(name__icontains=search) | Q(text__icontains=search))
+        queryset = search_recipes(queryset, search)
     if min_cooking_time:
         queryset = queryset.filter(cooking_time__gte=min_cooking_time)
     if max_cooking_time:
         queryset = queryset.filter(cooking_time__lte=max_cooking_time)
     if min_ingredients:
-        queryset = queryset.annotate(ingredient_count=Count('ingredients')).filter(ingredient_count__gte=min_ingredients)
+        queryset = queryset.filter(ingredient_count__gte=min_ingredients)
     if max_ingredients:
-        queryset = queryset.annotate(ingredient_count=Count('ingredients')).filter(ingredient_count__lte=max_ingredients)
+        queryset = queryset.filter(ingredient_count__lte=max_ingredients)
     if author_username:
         queryset = queryset.filter(author__username__icontains=author_username)
     if tags:
-        queryset = queryset.filter(tags__slug__in=tags).distinct()
-
-    if sort_by == 'popularity':
-        queryset = queryset.annotate(favorite_count=Count('favorite_recipe')).order_by(f'-favorite_count' if order == 'desc' else 'favorite_count')
+        queryset = queryset.filter(id__in=TagRecipe.objects.filter(
+            tag_id__in=tag_registry.get().ids_for_slugs(tags)
+        ).values('recipe_id'))
+
+    if sort_by == 'relevance' and search:
+        queryset = queryset.order_by('-search_rank' if order == 'desc' else 'search_rank', '-pub_date')
+    elif sort_by == 'popularity':
+        queryset = queryset.order_by('-favorite_count' if order == 'desc' else 'favorite_count')
     elif sort_by == 'name':
         queryset = queryset.order_by(f'-name' if order == 'desc' else 'name')
     elif sort_by == 'cooking_time':
@@ -357,86 +491,27 @@ def advanced_recipe_filter(request):
 
 @api_view(["GET"])
 def user_profile_detail(request, user_id):
-    user = get_object_or_404(User, id=user_id)
-    recipes_count = user.recipes.count()
-    followers_count = user.following.count()
-    following_count = user.follower.count()
-    recent_recipes = user.recipes.order_by('-pub_date')[:5]
-    recent_recipes_serializer = RecipeSerializer(recent_recipes, many=True, context={'request': request})
-    popular_recipes = user.recipes.annotate(favorite_count=Count('favorite_recipe')).order_by('-favorite_count')[:5]
-    popular_recipes_serializer = RecipeSerializer(popular_recipes, many=True, context={'request': request})
-    is_subscribed = False
-    if request.user.is_authenticated:
-        is_subscribed = user.follower.filter(user=request.user).exists()
-    user_serializer = CustomUserSerializer(user, context={'request': request})
-    return Response({
-        'user': user_serializer.data,
-        'statistics': {
-            'recipes_count': recipes_count,
-            'followers_count': followers_count,
-            'following_count': following_count,
-            'is_subscribed': is_subscribed
-        },
-        'recent_recipes': recent_recipes_serializer.data,
-        'popular_recipes': popular_recipes_serializer.data
-    })
+    """Профиль из кеша с подпиской и флагами текущего пользователя."""
+    profile = get_profile(user_id)
+    if profile is None:
+        raise Http404
+    subscribed_ids = get_subscribed_ids(request)
+    profile = personalize(profile, request, subscribed_ids)
+    profile['user'] = personalize_user(
+        profile['user'], request, subscribed_ids)
+    profile['statistics'] = {
+        **profile['statistics'],
+        'is_subscribed': profile['user']['is_subscribed'],
+    }
+    return Response(profile)
 
 @api_view(["GET"])
 def recipe_statistics(request):
-    total_recipes = Recipe.objects.count()
-    total_users = User.objects.count()
-    total_favorites = Favorite.objects.count()
-    total_shopping_lists = ShoppingList.objects.count()
-    from django.utils import timezone
-    from datetime import timedelta
-    week_ago = timezone.now() - timedelta(days=7)
-    new_recipes_week = Recipe.objects.filter(pub_date__gte=week_ago).count()
-    new_users_week = User.objects.filter(date_joined__gte=week_ago).count()
-    popular_recipes = Recipe.objects.annotate(favorite_count=Count('favorite_recipe')).order_by('-favorite_count')[:10]
-    popular_recipes_serializer = RecipeSerializer(popular_recipes, many=True, context={'request': request})
-    recent_recipes = Recipe.objects.order_by('-pub_date')[:10]
-    recent_recipes_serializer = RecipeSerializer(recent_recipes, many=True, context={'request': request})
-    tag_stats = Tag.objects.annotate(recipe_count=Count('recipe')).order_by('-recipe_count')[:10]
-    author_stats = User.objects.annotate(
-        recipe_count=Count('recipes'),
-        total_favorites=Count('recipes__favorite_recipe')
-    ).filter(recipe_count__gt=0).order_by('-recipe_count')[:10]
-    avg_cooking_time = Recipe.objects.aggregate(Avg('cooking_time'))['cooking_time__avg']
-    avg_ingredients_per_recipe = Recipe.objects.annotate(
-        ingredient_count=Count('ingredients')
-    ).aggregate(Avg('ingredient_count'))['ingredient_count__avg']
-    return Response({
-        'overall_statistics': {
-            'total_recipes': total_recipes,
-            'total_users': total_users,
-            'total_favorites': total_favorites,
-            'total_shopping_lists': total_shopping_lists,
-            'new_recipes_week': new_recipes_week,
-            'new_users_week': new_users_week,
-            'avg_cooking_time': round(avg_cooking_time, 1) if avg_cooking_time else 0,
-            'avg_ingredients_per_recipe': round(avg_ingredients_per_recipe, 1) if avg_ingredients_per_recipe else 0
-        },
-        'popular_recipes': popular_recipes_serializer.data,
-        'recent_recipes': recent_recipes_serializer.data,
-        'top_tags': [
-            {
-                'id': tag.id,
-                'name': tag.name,
-                'color': tag.color,
-                'slug': tag.slug,
-                'recipe_count': tag.recipe_count
-            }
-            for tag in tag_stats
-        ],
-        'top_authors': [
-            {
-                'id': author.id,
-                'username': author.username,
-                'first_name': author.first_name,
-                'last_name': author.last_name,
-                'recipe_count': author.recipe_count,
-                'total_favorites': author.total_favorites
-            }
-            for author in author_stats
-        ]
-    })
\ No newline at end of file
+    """Статистика из готового снимка.
+
+    ``?fresh=1`` от администратора пересчитывает снимок сразу.
+    """
+    fresh = request.user.is_staff and request.query_params.get('fresh') == '1'
+    return Response(personalize(
+        get_snapshot(fresh=fresh), request, get_subscribed_ids(request)
+    ))
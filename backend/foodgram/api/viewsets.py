@@ -1,5 +1,11 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from rest_framework import mixins, viewsets
 
+from api.cache import get_versions, user_state_version_key
+
 
 class ListRetriveViewSet(
     mixins.ListModelMixin,
@@ -15,4 +21,73 @@ class ListViewSet(
     viewsets.GenericViewSet
 ):
     """Вьюсет только list."""
-    pass
\ No newline at end of file
+    pass
+
+
+class KeysetPaginationMixin:
+    """Включает пагинацию по ключу по запросу клиента.
+
+    По умолчанию используется обычная постраничная пагинация, а
+    параметр ``pagination=cursor`` (или переданный ``cursor``)
+    переключает вьюсет на ``keyset_pagination_class``.
+    """
+
+    keyset_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if self.keyset_pagination_class is not None and (
+                params.get('pagination') == 'cursor' or 'cursor' in params
+            ):
+                self._paginator = self.keyset_pagination_class()
+                return self._paginator
+        return super().paginator
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы по ETag и Last-Modified.
+
+    Валидаторы считаются по версиям из кеша (``version_keys`` и, при
+    ``user_state_dependent``, версии состояния пользователя) без
+    обращения к БД, поэтому ответ 304 отдаётся до выборки и
+    сериализации.
+    """
+
+    version_keys = ()
+    user_state_dependent = False
+
+    def get_validators(self, request):
+        """Получить ETag и время последнего изменения."""
+        keys = list(self.version_keys)
+        user = request.user
+        if self.user_state_dependent and user.is_authenticated:
+            keys.append(user_state_version_key(user.id))
+        versions = get_versions(keys)
+        fingerprint = ':'.join(
+            [request.get_full_path(), str(user.id)]
+            + [str(versions[key]) for key in keys]
+        )
+        etag = '"{}"'.format(hashlib.md5(fingerprint.encode()).hexdigest())
+        return etag, max(versions.values()) // 10 ** 9
+
+    def conditional(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if self.user_state_dependent:
+                patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,16 @@
+"""Celery-приложение бэкенда.
+
+Брокер тот же, что у ``celeryconfig.app`` в корне репозитория
+(RabbitMQ из переменных окружения), но задачи и настройки берутся из
+Django: префикс ``CELERY_`` в ``settings.py`` и модули ``tasks.py``
+приложений.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+app = Celery('foodgram')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -65,14 +67,43 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.postgresql')
+# SQLite в памяти не ждёт блокировок, поэтому тестовая БД SQLite по
+# умолчанию хранится в файле: так работают тесты одновременных запросов.
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DEFAULT_TEST_DB_NAME = os.path.join(
+        tempfile.gettempdir(), 'foodgram_test.sqlite3')
+else:
+    DEFAULT_TEST_DB_NAME = None
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
+        'ENGINE': DB_ENGINE,
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST', 'postgres'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        'TEST': {
+            'NAME': os.getenv('TEST_DB_NAME', DEFAULT_TEST_DB_NAME),
+        },
+    }
+}
+
+# Версии кеша, фрагменты, снимок статистики и сброс токенов должны быть
+# общими для всех процессов, поэтому при заданном REDIS_URL кеш хранится
+# в Redis. Кеш в памяти процесса подходит только для тестов и запуска в
+# один процесс.
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL and 'test' not in sys.argv:
+    DEFAULT_CACHE_BACKEND = 'django.core.cache.backends.redis.RedisCache'
+else:
+    DEFAULT_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', DEFAULT_CACHE_BACKEND),
+        'LOCATION': os.getenv('CACHE_LOCATION', REDIS_URL),
     }
 }
 
@@ -107,15 +138,83 @@ MEDIA_URL = '/backend_media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend_media')
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'recipes.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+CELERY_BROKER_URL = 'amqp://{}:{}@{}:5672//'.format(
+    os.getenv('RABBITMQ_USER', 'myuser'),
+    os.getenv('RABBITMQ_PASSWORD', 'mypassword'),
+    os.getenv('RABBITMQ_HOST', 'localhost'),
+)
+CELERY_TASK_IGNORE_RESULT = True
+# Задачи выполняются сразу в процессе, который их ставит, в тестах и
+# когда брокер не задан (RABBITMQ_HOST не указан). Явное значение
+# CELERY_TASK_ALWAYS_EAGER важнее адреса брокера.
+CELERY_TASK_ALWAYS_EAGER = (
+    os.getenv(
+        'CELERY_TASK_ALWAYS_EAGER',
+        'False' if os.getenv('RABBITMQ_HOST') else 'True',
+    ).lower() in ('true', '1')
+    or 'test' in sys.argv
+)
+CELERY_BEAT_SCHEDULE = {
+    'refresh-statistics-snapshot': {
+        'task': 'api.tasks.refresh_statistics_snapshot',
+        'schedule': 15 * 60,
+    },
+    'refresh-feed-pull-authors': {
+        'task': 'api.tasks.refresh_feed_pull_authors',
+        'schedule': 15 * 60,
+    },
+    'collect-media-garbage': {
+        'task': 'api.tasks.collect_media_garbage',
+        'schedule': 60 * 60,
+    },
+}
+
+# Снимок статистики пересчитывается не чаще раза в столько секунд
+# после изменений данных.
+STATISTICS_REFRESH_DELAY = 60
+
+# Наибольший размер загружаемого изображения после декодирования base64.
+MAX_IMAGE_UPLOAD_SIZE = 10 * 1024 * 1024
+
+# Пользователь по токену хранится в общем кеше столько секунд, а в
+# памяти процесса - столько.
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+AUTH_TOKEN_LOCAL_TIMEOUT = 5
+
+# Медиафайлы без ссылок удаляются не раньше, чем через столько секунд
+# после того, как на них перестали ссылаться.
+MEDIA_GC_GRACE = 24 * 60 * 60
+
+# Рецепты авторов, у которых подписчиков не меньше этого числа, не
+# раскладываются по лентам, а подмешиваются при чтении ленты.
+FEED_PULL_FOLLOWERS = 10000
+
 DJOSER = {
     'LOGIN_FIELD': 'email'
 }
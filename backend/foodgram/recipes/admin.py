@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.db.models import Count, OuterRef
 
-from recipes.models import Favorite, Ingredient, Recipe, Tag
+from recipes import cart_totals
+from recipes.models import Ingredient, Recipe, Tag
 
 
 class TagsInline(admin.TabularInline):
@@ -90,16 +90,11 @@ class RecipeAdmin(admin.ModelAdmin):
         'tags',
     )
 
-    def get_queryset(self, request):
-        return Recipe.objects.annotate(
-            favorite_count=Count(
-                Favorite.objects.filter(recipe=OuterRef('pk')).values('id')
-            )
-        )
-
-    @admin.display(
-        ordering='favorite_count',
-        description='Количество добавлений в избранное',
-    )
-    def favorite_count(self, obj):
-        return obj.favorite_count
\ No newline at end of file
+    def save_related(self, request, form, formsets, change):
+        """Обновить счётчик ингредиентов и списки покупок после инлайнов."""
+        old_amounts = cart_totals.recipe_amounts(form.instance.id)
+        super().save_related(request, form, formsets, change)
+        new_amounts = cart_totals.recipe_amounts(form.instance.id)
+        Recipe.objects.filter(id=form.instance.id).update(
+            ingredient_count=len(new_amounts))
+        cart_totals.recipe_changed(form.instance.id, old_amounts, new_amounts)
\ No newline at end of file
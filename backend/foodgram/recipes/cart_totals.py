@@ -0,0 +1,136 @@
+"""Суммы ингредиентов в списках покупок.
+
+``ShoppingCartIngredient`` хранит для каждого пользователя сумму
+каждого ингредиента по рецептам из его списка покупок. Добавление и
+удаление рецепта и правка его ингредиентов применяются как разница
+количеств; ``rebuild`` пересчитывает суммы по ``ShoppingList``.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from recipes.models import (IngredientRecipe, ShoppingCartIngredient,
+                            ShoppingList)
+
+BATCH_SIZE = 1000
+
+
+def recipe_amounts(recipe_id):
+    """Количества ингредиентов рецепта: ``{id ингредиента: количество}``."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id=recipe_id)
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def recipes_amounts(recipe_ids):
+    """Суммарные количества ингредиентов нескольких рецептов."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .values('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+        .values_list('ingredient_id', 'total')
+    )
+
+
+def amounts_delta(old, new):
+    """Разница двух наборов количеств без нулевых значений."""
+    delta = {
+        ingredient_id: new.get(ingredient_id, 0) - old.get(ingredient_id, 0)
+        for ingredient_id in old.keys() | new.keys()
+    }
+    return {key: value for key, value in delta.items() if value}
+
+
+@transaction.atomic
+def apply_delta(user_ids, delta):
+    """Прибавить ``delta`` к суммам пользователей ``user_ids``.
+
+    Недостающие строки создаются с нулём, затем все суммы меняются
+    одним UPDATE, а обнулившиеся строки удаляются. Изменение через
+    ``F()`` безопасно при одновременных запросах.
+    """
+    if not delta:
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    ShoppingCartIngredient.objects.bulk_create(
+        (
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=0)
+            for user_id in user_ids for ingredient_id in delta
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    rows = ShoppingCartIngredient.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=delta,
+    )
+    rows.update(amount=F('amount') + Case(
+        *(When(ingredient_id=ingredient_id, then=Value(value))
+          for ingredient_id, value in delta.items()),
+        output_field=IntegerField(),
+    ))
+    rows.filter(amount__lte=0).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    add_recipes(user_id, [recipe_id])
+
+
+def remove_recipe(user_id, recipe_id):
+    remove_recipes(user_id, [recipe_id])
+
+
+def add_recipes(user_id, recipe_ids):
+    apply_delta([user_id], recipes_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    apply_delta([user_id], amounts_delta(recipes_amounts(recipe_ids), {}))
+
+
+def recipe_changed(recipe_id, old_amounts, new_amounts):
+    """Разнести правку ингредиентов рецепта по спискам покупок."""
+    delta = amounts_delta(old_amounts, new_amounts)
+    if delta:
+        apply_delta(
+            ShoppingList.objects.filter(recipe_id=recipe_id)
+            .values_list('user_id', flat=True),
+            delta,
+        )
+
+
+def aggregate_totals(ingredient_recipe_model, user_ids=None):
+    """Суммы по спискам покупок одним запросом с группировкой."""
+    lookups = {'recipe__shopping_recipe__isnull': False}
+    if user_ids is not None:
+        lookups['recipe__shopping_recipe__user__in'] = user_ids
+    return (
+        ingredient_recipe_model.objects.filter(**lookups)
+        .values('ingredient_id', user_id=F('recipe__shopping_recipe__user'))
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+
+
+@transaction.atomic
+def rebuild(user_ids=None, totals_model=ShoppingCartIngredient,
+            ingredient_recipe_model=IngredientRecipe):
+    """Пересчитать суммы всех пользователей или только ``user_ids``.
+
+    Модели передаются из миграции. Возвращает число записанных строк.
+    """
+    existing = totals_model.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+    existing.delete()
+    rows = [
+        totals_model(user_id=row['user_id'],
+                     ingredient_id=row['ingredient_id'],
+                     amount=row['total'])
+        for row in aggregate_totals(ingredient_recipe_model, user_ids)
+    ]
+    totals_model.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
@@ -0,0 +1,29 @@
+"""Денормализованные счётчики рецепта.
+
+``Recipe.ingredient_count`` и ``Recipe.favorite_count`` обновляются
+при записи, а функции модуля пересчитывают их по связанным таблицам
+(миграция и команда ``reconcile_counters``).
+"""
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count_by_recipe(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef('pk'))
+            .order_by()
+            .values('recipe')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def actual_counters(ingredient_recipe_model, favorite_model):
+    """Выражения с фактическими значениями счётчиков."""
+    return {
+        'ingredient_count': _count_by_recipe(ingredient_recipe_model),
+        'favorite_count': _count_by_recipe(favorite_model),
+    }
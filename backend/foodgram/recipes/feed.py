@@ -0,0 +1,132 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Лента хранится готовой в ``FeedEntry``: новый рецепт раскладывается
+по лентам подписчиков автора, подписка добавляет в ленту последние
+рецепты автора, отписка удаляет их. Рецепты авторов, у которых не
+меньше ``FEED_PULL_FOLLOWERS`` подписчиков, не раскладываются, а
+подмешиваются при чтении ленты (см. ``pull_author_ids``).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from recipes.models import FeedEntry, Follow, Recipe
+
+BATCH_SIZE = 1000
+BACKFILL_RECIPES = 50
+PULL_AUTHORS_KEY = 'feed:pull_authors'
+
+
+def find_pull_authors(follow_model=Follow):
+    """id авторов, рецепты которых читаются из ленты без раскладки."""
+    return frozenset(
+        follow_model.objects.values('following_id')
+        .annotate(total=Count('id'))
+        .filter(total__gte=settings.FEED_PULL_FOLLOWERS)
+        .order_by()
+        .values_list('following_id', flat=True)
+    )
+
+
+def pull_author_ids():
+    """Авторы с подмешиванием при чтении, из кеша."""
+    author_ids = cache.get(PULL_AUTHORS_KEY)
+    if author_ids is None:
+        author_ids = find_pull_authors()
+        cache.set(PULL_AUTHORS_KEY, author_ids, timeout=None)
+    return author_ids
+
+
+def refresh_pull_authors():
+    """Пересчитать авторов с подмешиванием при чтении.
+
+    Авторам, которые перестали быть такими, ленты подписчиков
+    дополняются их последними рецептами.
+    """
+    previous = cache.get(PULL_AUTHORS_KEY) or frozenset()
+    current = find_pull_authors()
+    cache.set(PULL_AUTHORS_KEY, current, timeout=None)
+    for author_id in previous - current:
+        fan_out(_latest_recipes(author_id), author_id)
+    return current
+
+
+def _latest_recipes(author_id, recipe_model=Recipe):
+    return list(
+        recipe_model.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('id', 'pub_date')[:BACKFILL_RECIPES]
+    )
+
+
+def _insert(user_ids, recipes, author_id, feed_entry_model=FeedEntry):
+    """Добавить рецепты ``(id, дата)`` в ленты ``user_ids`` пачками."""
+    entries = (
+        feed_entry_model(user_id=user_id, recipe_id=recipe_id,
+                         author_id=author_id, pub_date=pub_date)
+        for user_id in user_ids for recipe_id, pub_date in recipes
+    )
+    feed_entry_model.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out(recipes, author_id):
+    """Разложить рецепты автора по лентам его подписчиков."""
+    if not recipes or author_id in pull_author_ids():
+        return
+    followers = (
+        Follow.objects.filter(following_id=author_id)
+        .values_list('user_id', flat=True)
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    _insert(followers, recipes, author_id)
+
+
+def recipe_created(recipe_id):
+    """Разложить новый рецепт по лентам подписчиков автора."""
+    recipe = Recipe.objects.filter(id=recipe_id).values_list(
+        'author_id', 'pub_date').first()
+    if recipe is not None:
+        author_id, pub_date = recipe
+        fan_out([(recipe_id, pub_date)], author_id)
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту последние рецепты автора после подписки."""
+    if author_id in pull_author_ids():
+        return
+    if not Follow.objects.filter(
+            user_id=user_id, following_id=author_id).exists():
+        return
+    _insert([user_id], _latest_recipes(author_id), author_id)
+
+
+def prune(user_id, author_id):
+    """Убрать из ленты рецепты автора после отписки."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild(user_ids=None, feed_entry_model=FeedEntry, follow_model=Follow,
+            recipe_model=Recipe):
+    """Пересобрать ленты всех пользователей или только ``user_ids``.
+
+    Модели передаются из миграции. Возвращает число подписок, по
+    которым добавлены рецепты.
+    """
+    existing = feed_entry_model.objects.all()
+    follows = follow_model.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    existing.delete()
+    pull_authors = find_pull_authors(follow_model)
+    count = 0
+    for user_id, author_id in follows.values_list('user_id', 'following_id'):
+        if author_id in pull_authors:
+            continue
+        recipes = _latest_recipes(author_id, recipe_model)
+        _insert([user_id], recipes, author_id, feed_entry_model)
+        count += 1
+    return count
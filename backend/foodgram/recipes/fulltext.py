@@ -0,0 +1,89 @@
+"""Полнотекстовый индекс рецептов.
+
+На PostgreSQL у таблицы рецептов есть колонка ``search_vector`` с
+GIN-индексом. Её заполняет триггер по названию (вес A) и тексту
+(вес B) со стеммингом для русского и английского. На SQLite вместо
+колонки используется внешняя FTS5-таблица, которую синхронизируют
+триггеры. Русского стеммера в SQLite нет, поэтому там поиск идёт по
+префиксам слов.
+
+Колонку и триггер PostgreSQL создаёт миграция ``0004_recipe_fulltext``;
+миграции хранят собственные копии запросов. На SQLite миграция,
+пересоздающая таблицу рецептов, удаляет триггеры вместе со старой
+таблицей, поэтому поиск перед первым запросом проверяет их через
+``ensure_sqlite`` и при необходимости создаёт заново.
+"""
+
+TABLE = 'recipes_recipe'
+FTS_TABLE = 'recipes_recipe_fts'
+
+SQLITE_INSTALL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text, content='{TABLE}', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE ON {TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+SQLITE_TRIGGERS = (
+    f'{FTS_TABLE}_insert',
+    f'{FTS_TABLE}_delete',
+    f'{FTS_TABLE}_update',
+)
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def _sqlite_missing(cursor):
+    """Есть ли недостающие объекты FTS5-индекса."""
+    names = (FTS_TABLE,) + SQLITE_TRIGGERS
+    cursor.execute(
+        'SELECT count(*) FROM sqlite_master WHERE name IN (%s)'
+        % ', '.join('%s' for _ in names),
+        names,
+    )
+    return cursor.fetchone()[0] < len(names)
+
+
+def ensure_sqlite(connection):
+    """Проверить FTS5-индекс и триггеры, создать недостающие.
+
+    Возвращает ``False``, если SQLite собран без FTS5. После создания
+    индекс перестраивается по таблице рецептов.
+    """
+    if not sqlite_has_fts5(connection):
+        return False
+    with connection.cursor() as cursor:
+        if _sqlite_missing(cursor):
+            for statement in SQLITE_INSTALL:
+                cursor.execute(statement)
+    return True
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.storage import collect_garbage, collect_untracked
+
+
+class Command(BaseCommand):
+
+    help = 'Удаление медиафайлов, на которые нет ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_GC_GRACE,
+            help='Не удалять файлы, изменённые меньше столько секунд назад',
+        )
+        parser.add_argument(
+            '--untracked',
+            action='store_true',
+            help='Удалить и файлы хранилища, которых нет в базе',
+        )
+
+    def handle(self, *args, **options):
+        removed = collect_garbage(options['grace'])
+        if options['untracked']:
+            removed += collect_untracked(options['grace'])
+        self.stdout.write(f'Удалено файлов: {removed}')
@@ -0,0 +1,44 @@
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import BATCH_SIZE, iter_export
+
+
+class Command(BaseCommand):
+
+    help = 'Выгрузка рецептов в JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл для выгрузки, по умолчанию стандартный вывод',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Число рецептов в одной выборке',
+        )
+
+    def handle(self, *args, **options):
+        to_stdout = options['path'] == '-'
+        output = (
+            nullcontext(self.stdout) if to_stdout
+            else open(options['path'], 'w', encoding='utf-8')
+        )
+        started = time.monotonic()
+        count = 0
+        with output as file:
+            for line in iter_export(options['batch_size']):
+                file.write(line)
+                count += 1
+        elapsed = time.monotonic() - started
+        report = self.stderr if to_stdout else self.stdout
+        report.write(
+            f'Выгружено рецептов: {count} за {elapsed:.2f} с '
+            f'({count / max(elapsed, 1e-6):.0f} рецептов/с)'
+        )
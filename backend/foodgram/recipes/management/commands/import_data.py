@@ -1,37 +1,186 @@
+import csv
 import json
 import os
+import time
+from itertools import islice
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import (INGREDIENTS_VERSION_KEY, RECIPES_VERSION_KEY,
+                       bump_version)
 from recipes.models import Ingredient
 
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+
+
+def default_path():
+    """Файл ингредиентов по умолчанию.
+
+    В Docker контейнере файл находится в /app/ingredients.json,
+    в локальной разработке - в ../data/ingredients.json.
+    """
+    if os.path.exists('/app/ingredients.json'):
+        return Path('/app/ingredients.json')
+    base_dir = Path(__file__).resolve().parent.parent.parent.parent.parent
+    return base_dir / 'data' / 'ingredients.json'
+
+
+def iter_json(file):
+    """Элементы JSON-массива по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('Файл JSON оборван.')
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_json_rows(file):
+    """Строки ``(название, единица)`` из JSON.
+
+    Подходят и список объектов ``name``/``measurement_unit``, и фикстура
+    Django с полями в ``fields``.
+    """
+    for item in iter_json(file):
+        fields = item.get('fields', item)
+        yield fields['name'], fields['measurement_unit']
+
+
+def iter_csv_rows(file):
+    """Строки ``(название, единица)`` из CSV без заголовка или с ним."""
+    for row in csv.reader(file):
+        if not row or row == ['name', 'measurement_unit']:
+            continue
+        yield row[0], row[1]
+
+
+READERS = {
+    'json': iter_json_rows,
+    'csv': iter_csv_rows,
+}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
 
 class Command(BaseCommand):
 
-    help = 'Импорт ингредиентов'
+    help = 'Импорт ингредиентов из JSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            type=Path,
+            help='Файл ингредиентов, по умолчанию data/ingredients.json',
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Число строк в одном INSERT',
+        )
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Обновить единицы измерения существующих ингредиентов',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать изменения, ничего не записывая',
+        )
 
     def handle(self, *args, **options):
-        # Получаем путь к файлу ingredients.json
-        # В Docker контейнере файл находится в /app/ingredients.json
-        # В локальной разработке - в ../data/ingredients.json
-        if os.path.exists('/app/ingredients.json'):
-            # Docker контейнер
-            ingredients_file = '/app/ingredients.json'
-        else:
-            # Локальная разработка
-            base_dir = Path(__file__).resolve().parent.parent.parent.parent.parent
-            ingredients_file = base_dir / 'data' / 'ingredients.json'
-
-        with open(ingredients_file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-
-        for note in data:
-            try:
-                Ingredient.objects.get_or_create(**note)
-                print(f"{note['name']} в базе")
-            except Exception as error:
-                print(f"Ошибка при добавлении {note['name']}.\n"
-                      f"Текст - {error}")
-
-        print('Загрузка ингредиентов завершена')
\ No newline at end of file
+        path = options['path'] or default_path()
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть больше нуля.')
+        started = time.monotonic()
+        with open(path, encoding='utf-8', newline='') as file:
+            with transaction.atomic():
+                counts = self.import_rows(
+                    READERS[file_format](file), options)
+                if not options['dry_run'] and (
+                        counts['created'] or counts['updated']):
+                    transaction.on_commit(lambda: bump_version(
+                        INGREDIENTS_VERSION_KEY, RECIPES_VERSION_KEY))
+        elapsed = time.monotonic() - started
+        prefix = 'Проверено' if options['dry_run'] else 'Загружено'
+        self.stdout.write(
+            f'{prefix} строк: {counts["rows"]}, новых: {counts["created"]}, '
+            f'обновлено: {counts["updated"]}, '
+            f'без изменений: {counts["unchanged"]} '
+            f'за {elapsed:.2f} с ({counts["rows"] / max(elapsed, 1e-6):.0f} '
+            f'строк/с)'
+        )
+
+    def import_rows(self, rows, options):
+        """Записать строки пачками и вернуть счётчики.
+
+        На пачку - один запрос существующих названий и один INSERT; с
+        ``--update`` INSERT обновляет единицы измерения при конфликте.
+        """
+        counts = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0}
+        for batch in batches(rows, options['batch_size']):
+            counts['rows'] += len(batch)
+            units = {
+                name.strip(): unit.strip() for name, unit in batch
+                if name.strip()
+            }
+            existing = dict(
+                Ingredient.objects.filter(name__in=units)
+                .values_list('name', 'measurement_unit')
+            )
+            new = [name for name in units if name not in existing]
+            changed = [
+                name for name in units
+                if options['update'] and name in existing
+                and existing[name] != units[name]
+            ]
+            counts['created'] += len(new)
+            counts['updated'] += len(changed)
+            counts['unchanged'] += len(existing) - len(changed)
+            if options['dry_run'] or not (new or changed):
+                continue
+            ingredients = [
+                Ingredient(name=name, measurement_unit=units[name])
+                for name in new + changed
+            ]
+            if options['update']:
+                Ingredient.objects.bulk_create(
+                    ingredients,
+                    update_conflicts=True,
+                    unique_fields=['name'],
+                    update_fields=['measurement_unit'],
+                )
+            else:
+                Ingredient.objects.bulk_create(
+                    ingredients, ignore_conflicts=True)
+        return counts
@@ -0,0 +1,43 @@
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import BATCH_SIZE, Importer
+
+
+class Command(BaseCommand):
+
+    help = 'Загрузка рецептов из JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл JSONL, "-" - стандартный ввод',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Число рецептов в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        source = (
+            nullcontext(sys.stdin) if options['path'] == '-'
+            else open(options['path'], encoding='utf-8')
+        )
+        started = time.monotonic()
+        importer = Importer(options['batch_size'])
+        with source as file:
+            counts = importer.run(file)
+        elapsed = time.monotonic() - started
+        for error in importer.errors:
+            self.stderr.write(error)
+        self.stdout.write(
+            f'Строк: {counts["rows"]}, добавлено: {counts["created"]}, '
+            f'пропущено: {counts["skipped"]}, ошибок: {counts["errors"]} '
+            f'за {elapsed:.2f} с '
+            f'({counts["rows"] / max(elapsed, 1e-6):.0f} строк/с)'
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import rebuild, refresh_pull_authors
+
+
+class Command(BaseCommand):
+
+    help = 'Пересборка лент рецептов по подпискам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Пересобрать только ленту пользователя с этим id',
+        )
+
+    def handle(self, *args, **options):
+        refresh_pull_authors()
+        count = rebuild(options['user_ids'])
+        self.stdout.write(f'Заполнено лент по подпискам: {count}')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cart_totals import rebuild
+
+
+class Command(BaseCommand):
+
+    help = 'Пересчёт сумм ингредиентов в списках покупок по ShoppingList'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Пересчитать только для пользователя с этим id',
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild(options['user_ids'])
+        self.stdout.write(f'Записано сумм ингредиентов: {count}')
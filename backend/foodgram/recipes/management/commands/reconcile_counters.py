@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from recipes.counters import actual_counters
+from recipes.models import Favorite, IngredientRecipe, Recipe
+
+
+class Command(BaseCommand):
+
+    help = 'Пересчёт счётчиков ингредиентов и избранного у рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число рецептов с расхождениями',
+        )
+
+    def handle(self, *args, **options):
+        expressions = actual_counters(IngredientRecipe, Favorite)
+        drifted = Recipe.objects.annotate(
+            actual_ingredient_count=expressions['ingredient_count'],
+            actual_favorite_count=expressions['favorite_count'],
+        ).filter(
+            ~Q(ingredient_count=F('actual_ingredient_count'))
+            | ~Q(favorite_count=F('actual_favorite_count'))
+        )
+        with transaction.atomic():
+            ids = list(drifted.values_list('id', flat=True))
+            if ids and not options['dry_run']:
+                Recipe.objects.filter(id__in=ids).update(**expressions)
+        action = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(f'{action} рецептов с расхождениями: {len(ids)}')
@@ -0,0 +1,118 @@
+from django.db import migrations
+
+# Запросы скопированы из recipes.fulltext на момент миграции, чтобы
+# её результат не зависел от последующих правок модуля.
+TABLE = 'recipes_recipe'
+FTS_TABLE = 'recipes_recipe_fts'
+
+POSTGRESQL_VECTOR = """
+    setweight(to_tsvector('russian', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce({row}text, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce({row}text, '')), 'B')
+"""
+
+POSTGRESQL_INSTALL = (
+    f'ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    f"""
+    CREATE OR REPLACE FUNCTION {TABLE}_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {POSTGRESQL_VECTOR.format(row='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f'DROP TRIGGER IF EXISTS {TABLE}_search_vector_trigger ON {TABLE}',
+    f"""
+    CREATE TRIGGER {TABLE}_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION {TABLE}_search_vector_update()
+    """,
+    f"UPDATE {TABLE} SET search_vector = {POSTGRESQL_VECTOR.format(row='')}",
+    f"""
+    CREATE INDEX IF NOT EXISTS {TABLE}_search_vector_idx
+    ON {TABLE} USING gin (search_vector)
+    """,
+)
+
+POSTGRESQL_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {TABLE}_search_vector_trigger ON {TABLE}',
+    f'DROP FUNCTION IF EXISTS {TABLE}_search_vector_update()',
+    f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector',
+)
+
+SQLITE_INSTALL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text, content='{TABLE}', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE ON {TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+SQLITE_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def statements(connection, install):
+    if connection.vendor == 'postgresql':
+        return POSTGRESQL_INSTALL if install else POSTGRESQL_UNINSTALL
+    if connection.vendor == 'sqlite' and sqlite_has_fts5(connection):
+        return SQLITE_INSTALL if install else SQLITE_UNINSTALL
+    return ()
+
+
+def install(apps, schema_editor):
+    for statement in statements(schema_editor.connection, install=True):
+        schema_editor.execute(statement)
+
+
+def uninstall(apps, schema_editor):
+    for statement in statements(schema_editor.connection, install=False):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+BACKFILL_RECIPES = 50
+
+
+def populate_feeds(apps, schema_editor):
+    """Заполнить ленты последними рецептами авторов из подписок.
+
+    Рецепты авторов, у которых не меньше ``FEED_PULL_FOLLOWERS``
+    подписчиков, подмешиваются при чтении и не раскладываются.
+    """
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Follow = apps.get_model('recipes', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    pull_authors = frozenset(
+        Follow.objects.values('following_id')
+        .annotate(total=Count('id'))
+        .filter(total__gte=settings.FEED_PULL_FOLLOWERS)
+        .order_by()
+        .values_list('following_id', flat=True)
+    )
+    follows = Follow.objects.values_list('user_id', 'following_id')
+    for user_id, author_id in follows:
+        if author_id in pull_authors:
+            continue
+        recipes = (
+            Recipe.objects.filter(author_id=author_id)
+            .order_by('-pub_date', '-id')
+            .values_list('id', 'pub_date')[:BACKFILL_RECIPES]
+        )
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                          author_id=author_id, pub_date=pub_date)
+                for recipe_id, pub_date in recipes
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_shopping_cart_ingredient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата добавления рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Рецепт в ленте',
+                'verbose_name_plural': 'Рецепты в лентах',
+                'indexes': [models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_entry_user_date_idx'), models.Index(fields=['user', 'author'], name='feed_entry_user_author_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(populate_feeds, migrations.RunPython.noop),
+    ]
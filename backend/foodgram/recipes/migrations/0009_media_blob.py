@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Путь')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Размер')),
+                ('refs', models.IntegerField(default=0, verbose_name='Число ссылок')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменён')),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+                'indexes': [models.Index(condition=models.Q(('refs__lte', 0)), fields=['updated_at'], name='media_blob_orphan_idx')],
+            },
+        ),
+    ]
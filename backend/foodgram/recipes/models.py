@@ -79,6 +79,12 @@ class Recipe(models.Model):
         'Фото блюда',
         upload_to='backend-media/recipes/images/',
     )
+    image_renditions = models.JSONField(
+        'Уменьшенные копии фото',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         'Рецепт',
     )
@@ -105,9 +111,25 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True,
     )
+    ingredient_count = models.PositiveIntegerField(
+        'Количество ингредиентов',
+        default=0,
+        db_index=True,
+    )
+    favorite_count = models.PositiveIntegerField(
+        'Количество добавлений в избранное',
+        default=0,
+        db_index=True,
+    )
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -252,4 +274,115 @@ class ShoppingList(models.Model):
         verbose_name_plural = 'Рецепты в списке покупок'
 
     def __str__(self) -> str:
-        return f'{self.recipe} в списке покупок у {self.user}'
\ No newline at end of file
+        return f'{self.recipe} в списке покупок у {self.user}'
+
+
+class ShoppingCartIngredient(models.Model):
+    """Сумма ингредиента по рецептам из списка покупок пользователя.
+
+    Поддерживается при изменении списка покупок и ингредиентов
+    рецептов, пересобирается командой ``rebuild_shopping_cart_totals``.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_cart_totals',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+    )
+    amount = models.IntegerField('Количество')
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient'
+            ),
+        )
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+
+    def __str__(self) -> str:
+        return f'{self.ingredient} - {self.amount} у {self.user}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика.
+
+    Дата публикации и автор рецепта повторены здесь, чтобы страница
+    ленты читалась по индексу без join-а, а отписка удаляла записи
+    одним запросом.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Автор рецепта',
+    )
+    pub_date = models.DateTimeField('Дата добавления рецепта')
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_entry_user_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_entry_user_author_idx',
+            ),
+        )
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Рецепты в лентах'
+
+    def __str__(self) -> str:
+        return f'{self.recipe} в ленте у {self.user}'
+
+
+class MediaBlob(models.Model):
+    """Файл в хранилище с именами по содержимому.
+
+    ``refs`` - сколько полей моделей ссылается на файл. Файлы без
+    ссылок удаляет сборка мусора (см. ``recipes.storage``).
+    """
+
+    name = models.CharField('Путь', max_length=100, primary_key=True)
+    size = models.PositiveBigIntegerField('Размер', default=0)
+    refs = models.IntegerField('Число ссылок', default=0)
+    updated_at = models.DateTimeField('Изменён', auto_now=True)
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('updated_at',),
+                condition=models.Q(refs__lte=0),
+                name='media_blob_orphan_idx',
+            ),
+        )
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self) -> str:
+        return self.name
@@ -0,0 +1,237 @@
+"""Хранилище медиафайлов с именами по содержимому.
+
+Файл сохраняется под именем ``blobs/<xx>/<sha256><расширение>``, и если
+такой файл уже есть, повторная запись пропускается: одна и та же
+картинка, присланная снова при редактировании рецепта, на диск не
+пишется. Для каждого файла в ``MediaBlob`` ведётся счётчик ссылок:
+``save`` его увеличивает, ``delete`` и замена файла в поле модели
+(``release_replaced``) - уменьшают. Счётчики меняются в текущей
+транзакции и откатываются вместе с ней. Сами файлы без ссылок
+удаляет ``collect_garbage`` пачками, спустя ``MEDIA_GC_GRACE`` секунд.
+
+Ссылку на файл в поле модели освобождает сохранение или удаление
+модели, поэтому ``FieldFile.delete()`` для таких полей не вызывается.
+Файлы со старыми именами (не в ``blobs/``) хранилище не считает и
+при освобождении ссылок не удаляет.
+"""
+import hashlib
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.models import MediaBlob
+
+BLOB_DIR = 'blobs'
+GC_BATCH_SIZE = 500
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{BLOB_DIR}/')
+
+
+def _change_refs(names, delta):
+    """Изменить счётчики ссылок: по запросу на каждое число повторов."""
+    by_count = {}
+    for name, count in Counter(filter(is_blob, names)).items():
+        by_count.setdefault(count, []).append(name)
+    now = timezone.now()
+    for count, group in by_count.items():
+        MediaBlob.objects.filter(name__in=group).update(
+            refs=F('refs') + delta * count, updated_at=now)
+
+
+def _file_size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
+
+
+def acquire(names):
+    """Добавить ссылки на уже сохранённые файлы.
+
+    Нужно, когда путь файла записывается в поле напрямую, например при
+    загрузке рецептов из JSONL. Для файлов без строки в ``MediaBlob``
+    строка создаётся, иначе сборка мусора удалила бы их как чужие.
+    """
+    _add_refs({
+        name: (count, _file_size(name))
+        for name, count in Counter(filter(is_blob, names)).items()
+    })
+
+
+def release(names):
+    """Убрать ссылки на файлы; файлы без ссылок удалит сборка мусора."""
+    _change_refs(names, -1)
+
+
+def _add_refs(refs):
+    """Увеличить счётчики ссылок одним запросом, создав недостающие строки.
+
+    ``refs`` - ``{путь: (число ссылок, размер)}``.
+    """
+    if not refs:
+        return
+    quote = connection.ops.quote_name
+    table = quote(MediaBlob._meta.db_table)
+    now = timezone.now()
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(refs))
+    params = [
+        value for name, (count, size) in refs.items()
+        for value in (name, size, count, now)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({quote("name")}, {quote("size")}, '
+            f'{quote("refs")}, {quote("updated_at")}) '
+            f'VALUES {values} ON CONFLICT ({quote("name")}) '
+            f'DO UPDATE SET {quote("refs")} = '
+            f'{table}.{quote("refs")} + EXCLUDED.{quote("refs")}, '
+            f'{quote("updated_at")} = EXCLUDED.{quote("updated_at")}',
+            params,
+        )
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с именами по SHA-256 содержимого."""
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        name = f'{BLOB_DIR}/{digest[:2]}/{digest}{extension}'
+        # Строка создаётся до проверки файла: сборка мусора держит
+        # блокировку строки, пока удаляет файл.
+        _add_refs({name: (1, size)})
+        if not self.exists(name):
+            saved = super()._save(name, content)
+            if saved != name:
+                # Тот же файл одновременно записал другой запрос.
+                super().delete(saved)
+        return name
+
+    def delete(self, name):
+        """Убрать ссылку на файл; старые файлы удаляются сразу."""
+        if is_blob(name):
+            release([name])
+        else:
+            super().delete(name)
+
+    def purge(self, name):
+        """Удалить файл с диска."""
+        super().delete(name)
+
+
+def _field_names(instance, fields):
+    """Имена файлов в загруженных полях объекта."""
+    names = {}
+    for field in fields:
+        if field in instance.__dict__:
+            value = instance.__dict__[field]
+            names[field] = getattr(value, 'name', value) or None
+    return names
+
+
+def remember(instance, fields):
+    """Запомнить файлы объекта после загрузки или сохранения."""
+    instance._stored_files = _field_names(instance, fields)
+
+
+def mark_pending(instance, fields):
+    """Перед сохранением отметить поля, в которые записывается файл."""
+    instance._pending_files = {
+        field for field in fields
+        if field in instance.__dict__
+        and not getattr(getattr(instance, field), '_committed', True)
+    }
+
+
+def release_replaced(instance, fields):
+    """После сохранения убрать ссылки на заменённые файлы.
+
+    Файл заменён, если имя изменилось или в поле записан новый файл:
+    тот же файл, загруженный снова, получает ещё одну ссылку, и старую
+    нужно убрать.
+    """
+    stored = getattr(instance, '_stored_files', {})
+    pending = getattr(instance, '_pending_files', set())
+    current = _field_names(instance, fields)
+    release(
+        stored[field] for field in current
+        if stored.get(field)
+        and (field in pending or stored[field] != current[field])
+    )
+    instance._pending_files = set()
+    remember(instance, fields)
+
+
+def collect_garbage(grace=None, batch_size=GC_BATCH_SIZE, storage=None):
+    """Удалить файлы без ссылок, не менявшиеся дольше ``grace`` секунд.
+
+    Строки выбираются с ``FOR UPDATE SKIP LOCKED``: сохранение того же
+    файла в это время ждёт удаления строки и пишет файл заново.
+    Возвращает число удалённых файлов.
+    """
+    storage = storage or default_storage
+    if grace is None:
+        grace = settings.MEDIA_GC_GRACE
+    deadline = timezone.now() - timedelta(seconds=grace)
+    removed = 0
+    while True:
+        with transaction.atomic():
+            names = list(
+                MediaBlob.objects.select_for_update(skip_locked=True)
+                .filter(refs__lte=0, updated_at__lt=deadline)
+                .values_list('name', flat=True)[:batch_size]
+            )
+            for name in names:
+                storage.purge(name)
+            MediaBlob.objects.filter(name__in=names).delete()
+        removed += len(names)
+        if len(names) < batch_size:
+            return removed
+
+
+def collect_untracked(grace=None, batch_size=GC_BATCH_SIZE, storage=None):
+    """Удалить файлы ``blobs/`` без строки в ``MediaBlob``.
+
+    Такие файлы остаются, если транзакция с сохранением откатилась.
+    Возвращает число удалённых файлов.
+    """
+    storage = storage or default_storage
+    if grace is None:
+        grace = settings.MEDIA_GC_GRACE
+    deadline = timezone.now() - timedelta(seconds=grace)
+    removed = 0
+    root = storage.path(BLOB_DIR)
+    if not os.path.isdir(root):
+        return removed
+    for directory in os.scandir(root):
+        if not directory.is_dir():
+            continue
+        files = {
+            f'{BLOB_DIR}/{directory.name}/{entry.name}': entry
+            for entry in os.scandir(directory.path) if entry.is_file()
+        }
+        names = list(files)
+        for start in range(0, len(names), batch_size):
+            batch = names[start:start + batch_size]
+            tracked = set(MediaBlob.objects.filter(
+                name__in=batch).values_list('name', flat=True))
+            for name in batch:
+                modified = datetime.fromtimestamp(
+                    files[name].stat().st_mtime, tz=dt_timezone.utc)
+                if name not in tracked and modified < deadline:
+                    storage.purge(name)
+                    removed += 1
+    return removed
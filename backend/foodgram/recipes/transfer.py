@@ -0,0 +1,222 @@
+"""Выгрузка и загрузка рецептов в формате JSONL.
+
+Каждая строка - один рецепт. Автор, теги и ингредиенты указываются
+естественными ключами (имя пользователя, slug, название), картинка -
+путём в хранилище медиафайлов, поэтому файлы переносятся отдельно и
+не декодируются при загрузке. И выгрузка, и загрузка идут пачками по
+``BATCH_SIZE`` рецептов, так что память не зависит от размера файла.
+"""
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from api.cache import RECIPES_VERSION_KEY, bump_profile_version, bump_version
+from api.statistics import schedule_refresh
+from recipes import feed, storage
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag, TagRecipe
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+def _export_batch(recipes):
+    ids = [recipe.id for recipe in recipes]
+    tags = defaultdict(list)
+    for recipe_id, slug in (
+        TagRecipe.objects.filter(recipe_id__in=ids)
+        .order_by('tag_id').values_list('recipe_id', 'tag__slug')
+    ):
+        tags[recipe_id].append(slug)
+    ingredients = defaultdict(list)
+    for recipe_id, name, unit, amount in (
+        IngredientRecipe.objects.filter(recipe_id__in=ids)
+        .order_by('id').values_list(
+            'recipe_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount')
+    ):
+        ingredients[recipe_id].append(
+            {'name': name, 'measurement_unit': unit, 'amount': amount})
+    for recipe in recipes:
+        yield {
+            'name': recipe.name,
+            'author': recipe.author.username,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': recipe.image.name,
+            'pub_date': recipe.pub_date.isoformat(),
+            'tags': tags[recipe.id],
+            'ingredients': ingredients[recipe.id],
+        }
+
+
+def iter_export(batch_size=BATCH_SIZE):
+    """Строки JSONL со всеми рецептами в порядке ``id``.
+
+    Рецепты выбираются по ключу ``id`` пачками, теги и ингредиенты
+    пачки - двумя запросами.
+    """
+    last_id = 0
+    while True:
+        recipes = list(
+            Recipe.objects.filter(id__gt=last_id).select_related('author')
+            .order_by('id')[:batch_size]
+        )
+        if not recipes:
+            return
+        for record in _export_batch(recipes):
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+        last_id = recipes[-1].id
+
+
+class RecordError(ValueError):
+    """Строка JSONL не подходит для загрузки."""
+
+
+class Importer:
+    """Загрузка рецептов из строк JSONL.
+
+    Рецепты с уже существующими названиями пропускаются, поэтому
+    повторная загрузка того же файла ничего не меняет. Ошибки строк
+    собираются в ``errors`` и не прерывают загрузку.
+    """
+
+    max_errors = 100
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.counts = {'rows': 0, 'created': 0, 'skipped': 0, 'errors': 0}
+        self.errors = []
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        }
+
+    def run(self, lines):
+        numbered = (
+            (number, line) for number, line in enumerate(lines, start=1)
+            if line.strip()
+        )
+        while batch := list(islice(numbered, self.batch_size)):
+            self.counts['rows'] += len(batch)
+            self.import_batch(batch)
+        return self.counts
+
+    def error(self, number, message):
+        self.counts['errors'] += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f'Строка {number}: {message}')
+
+    def parse(self, record, authors):
+        """Рецепт, дата, id тегов и количества ингредиентов записи."""
+        try:
+            author_id = authors.get(record['author'])
+            if author_id is None:
+                raise RecordError(f'нет автора {record["author"]}')
+            pub_date = record.get('pub_date')
+            pub_date = parse_datetime(pub_date) if pub_date else None
+            cooking_time = int(record['cooking_time'])
+            if cooking_time < 1:
+                raise RecordError('время приготовления меньше минуты')
+            tag_ids = []
+            for slug in record.get('tags', ()):
+                if slug not in self.tags:
+                    raise RecordError(f'нет тега {slug}')
+                tag_ids.append(self.tags[slug])
+            amounts = {}
+            for item in record['ingredients']:
+                key = (item['name'], item['measurement_unit'])
+                if key not in self.ingredients:
+                    raise RecordError(f'нет ингредиента {item["name"]}')
+                amount = int(item['amount'])
+                if amount < 1:
+                    raise RecordError('количество меньше единицы')
+                amounts[self.ingredients[key]] = amount
+            if not amounts:
+                raise RecordError('нет ингредиентов')
+            recipe = Recipe(
+                name=record['name'],
+                author_id=author_id,
+                text=record['text'],
+                cooking_time=cooking_time,
+                image=record['image'],
+                ingredient_count=len(amounts),
+            )
+        except RecordError:
+            raise
+        except (KeyError, TypeError, ValueError) as error:
+            raise RecordError(f'некорректная запись ({error!r})')
+        return recipe, pub_date, set(tag_ids), amounts
+
+    def import_batch(self, batch):
+        records = []
+        for number, line in batch:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self.error(number, 'некорректный JSON')
+                continue
+            if not isinstance(record, dict):
+                self.error(number, 'ожидался объект')
+                continue
+            records.append((number, record))
+        authors = dict(User.objects.filter(
+            username__in={str(record.get('author')) for _, record in records}
+        ).values_list('username', 'id'))
+        existing = set(Recipe.objects.filter(
+            name__in={str(record.get('name')) for _, record in records}
+        ).values_list('name', flat=True))
+        parsed = {}
+        for number, record in records:
+            try:
+                recipe, pub_date, tag_ids, amounts = self.parse(
+                    record, authors)
+            except RecordError as error:
+                self.error(number, error)
+                continue
+            if recipe.name in existing or recipe.name in parsed:
+                self.counts['skipped'] += 1
+                continue
+            parsed[recipe.name] = (recipe, pub_date, tag_ids, amounts)
+        if parsed:
+            self.write(list(parsed.values()))
+
+    @transaction.atomic
+    def write(self, rows):
+        recipes = Recipe.objects.bulk_create(
+            [recipe for recipe, *_ in rows])
+        dated = []
+        for recipe, pub_date, _, _ in rows:
+            if pub_date is not None:
+                recipe.pub_date = pub_date
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ['pub_date'])
+        storage.acquire(recipe.image.name for recipe in recipes)
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, _, tag_ids, _ in rows for tag_id in tag_ids
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe_id=recipe.id, ingredient_id=ingredient_id,
+                             amount=amount)
+            for recipe, _, _, amounts in rows
+            for ingredient_id, amount in amounts.items()
+        )
+        self.counts['created'] += len(recipes)
+        by_author = defaultdict(list)
+        for recipe in recipes:
+            by_author[recipe.author_id].append((recipe.id, recipe.pub_date))
+        transaction.on_commit(lambda: self.imported(by_author))
+
+    def imported(self, by_author):
+        """То же, что делают сигналы при сохранении рецепта."""
+        bump_version(RECIPES_VERSION_KEY)
+        bump_profile_version(*by_author)
+        schedule_refresh()
+        for author_id, recipes in by_author.items():
+            feed.fan_out(recipes, author_id)
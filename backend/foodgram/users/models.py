@@ -17,6 +17,12 @@ class User(AbstractUser):
         blank=True,
         null=True,
     )
+    avatar_renditions = models.JSONField(
+        'Уменьшенные копии аватара',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']